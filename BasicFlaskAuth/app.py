@@ -1,5 +1,9 @@
 from flask import Flask, request, abort
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -18,6 +22,72 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class VerifiedTokenCache:
+    """Bounded LRU of already verified tokens, keyed by the token's sha256.
+
+    A client sends the same access token until it expires, so its payload
+    is kept until its `exp` claim and later requests skip the RS256 check.
+    Keep it in sync with the coffee shop's src/auth/token_cache.py.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.tokens.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self.tokens[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.tokens.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        if self.max_size <= 0 or 'exp' not in payload:
+            return
+        key = self.key(token)
+        with self.lock:
+            self.tokens[key] = (payload, payload['exp'])
+            self.tokens.move_to_end(key)
+            while len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.tokens),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+verified_tokens = VerifiedTokenCache()
+
+
 def get_token_auth_header():
     """Obtains the Access Token from the Authorization Header
     """
@@ -52,6 +122,10 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+
     jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
     jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
@@ -80,7 +154,7 @@ def verify_decode_jwt(token):
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
-
+            verified_tokens.put(token, payload)
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -4,16 +4,25 @@
 
 import json
 import dateutil.parser
-import babel
+import babel.dates
+import functools
 from flask import Flask, render_template, request, Response, flash, redirect, url_for , abort , jsonify
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from perf import PerfMonitor
+from pool import pool_status
+from routing import RoutingSQLAlchemy
+from cache import FragmentCache, PageCache, page_store
+from importer import ImportSpec, BulkImporter, read_rows, text_stream, guess_format, FORMATS, BATCH_SIZE
+from markupsafe import Markup
 from sys import exc_info;
+import time
+import threading
+import click
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,17 +30,43 @@ from sys import exc_info;
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
+#the searches are POSTs that only read , they can run on a replica
+db.read_only('search_venues' , 'search_artists')
 
 # TODO_DONE: connect to a local postgresql database
 migrate = Migrate(app , db)
 
+#number of shows rendered per page of /shows
+SHOWS_PER_PAGE = 30
+
+#the artist directory : artists per page and the letters it is indexed by ('#' for any other first character)
+ARTISTS_PER_PAGE = 50
+ARTIST_INDEX = [chr(code) for code in range(ord('A') , ord('Z') + 1)] + ['#']
+#rendered directory pages keyed by (letter , page) , dropped whenever an artist is created or edited
+artist_pages = FragmentCache(max_entries=app.config['ARTIST_PAGES_CACHE_SIZE'] , ttl=app.config['ARTIST_PAGES_CACHE_TTL'])
+
+#rendered venue and artist pages keyed by 'venue:<id>' / 'artist:<id>' , see detail_page()
+detail_pages = PageCache(page_store(app.config['PAGE_CACHE_URL'] , app.config['PAGE_CACHE_SIZE']) ,
+                         max_ttl=app.config['PAGE_CACHE_TTL'])
+
+#per request SQL counters , off unless PERF_SAMPLE_RATE is set in config.py
+perf_monitor = PerfMonitor(sample_rate=app.config['PERF_SAMPLE_RATE'],
+                           slow_query_ms=app.config['PERF_SLOW_QUERY_MS'])
+perf_monitor.init_app(app)
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+      #venue_areas() groups and orders the venues by location
+      db.Index('ix_venue_city_state_id' , 'city' , 'state' , 'id'),
+      #trigram index so the name ILIKE '%term%' searches do not scan the table (postgres pg_trgm)
+      db.Index('ix_venue_name_trgm' , 'name' , postgresql_using='gin' , postgresql_ops={'name' : 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -49,10 +84,21 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean , default=False)
     seeking_description = db.Column(db.String())
     shows = db.relationship('Show', backref='venue', lazy=True , passive_deletes=True)
+    #maintained show counters so the listings never count the show table , see refresh_show_counts
+    upcoming_shows_count = db.Column(db.Integer , nullable=False , default=0 , server_default='0')
+    past_shows_count = db.Column(db.Integer , nullable=False , default=0 , server_default='0')
+    #start time of the next upcoming show , the counters are rolled once it has passed
+    next_show_at = db.Column(db.DateTime , index=True)
 
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+      #the artist directory is listed by name
+      db.Index('ix_artist_name_id' , 'name' , 'id'),
+      #trigram index so the name ILIKE '%term%' searches do not scan the table (postgres pg_trgm)
+      db.Index('ix_artist_name_trgm' , 'name' , postgresql_using='gin' , postgresql_ops={'name' : 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -68,29 +114,308 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean , default=False)
     seeking_description = db.Column(db.String())
     shows = db.relationship('Show', backref='artist', lazy=True , passive_deletes=True)
+    #same counters as Venue
+    upcoming_shows_count = db.Column(db.Integer , nullable=False , default=0 , server_default='0')
+    past_shows_count = db.Column(db.Integer , nullable=False , default=0 , server_default='0')
+    next_show_at = db.Column(db.DateTime , index=True)
 
 
 class Show(db.Model):
   __tablename__ = 'show'
+  __table_args__ = (
+    #the shows of a venue / an artist are always read together with their start time
+    db.Index('ix_show_venue_id_start_time' , 'venue_id' , 'start_time'),
+    db.Index('ix_show_artist_id_start_time' , 'artist_id' , 'start_time'),
+  )
   # TODO_DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
   artist_id = db.Column( db.Integer , db.ForeignKey('artist.id' , ondelete='CASCADE' ) , nullable=False , primary_key=True)
   venue_id = db.Column( db.Integer , db.ForeignKey('venue.id' , ondelete='CASCADE') , nullable = False , primary_key=True)
   start_time = db.Column(db.DateTime , nullable=False)
 
+class ImportCheckpoint(db.Model):
+  # progress of the named bulk import jobs , see importer.py
+  __tablename__ = 'import_checkpoint'
+  job = db.Column(db.String(200) , primary_key=True)
+  rows_done = db.Column(db.Integer , nullable=False , default=0)
+  updated_at = db.Column(db.DateTime , nullable=False)
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+#named formats of the datetime filter , any other format is used as a babel pattern
+DATETIME_FORMATS = {
+  'full' : "EEEE MMMM, d, y 'at' h:mma",
+  'medium' : "EE MM, dd, y h:mma"
+}
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  # the compiled babel pattern and the locale of a (format , locale) pair , resolved once per process.
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)) , babel.Locale.parse(locale)
+
+def format_datetime(value, format='medium', locale=None):
+  # the views pass datetime objects , only strings (e.g. from a form) are parsed.
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  pattern , locale = datetime_pattern(format, locale or babel.dates.LC_TIME)
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def venue_areas():
+  # builds the /venues listing with a single round trip over the venue table , the
+  # upcoming shows come from the maintained counter so the show table is not read and
+  # the number of queries does not grow with the number of locations or venues.
+  rows = db.session.query(Venue.city , Venue.state , Venue.id , Venue.name , Venue.upcoming_shows_count , Venue.next_show_at)\
+    .order_by(Venue.city , Venue.state , Venue.id)\
+    .all()
+
+  #every venue was read , the earliest next show tells when the counters are due (see roll_due_show_counts)
+  next_shows = [row.next_show_at for row in rows if row.next_show_at is not None]
+  show_counts_roll['due_at'] = min(next_shows) if next_shows else None
+
+  #rows are ordered by location so each area is a contiguous run of rows.
+  areas=[]
+  for city , state , venue_id , venue_name , n_upcoming_shows , _ in rows:
+    if not areas or areas[-1]['city'] != city or areas[-1]['state'] != state:
+      areas.append({
+        "city" : city,
+        "state" : state,
+        "venues" : []
+      })
+    areas[-1]['venues'].append({
+      "id" : venue_id,
+      "name" : venue_name,
+      "num_upcoming_shows" : n_upcoming_shows
+    })
+  return areas
+
+def artist_directory_page(letter , page):
+  # one page of the artist directory , only (id , name) are loaded.
+  # letter is '' for every artist , a letter of ARTIST_INDEX otherwise.
+  # returns (artists , has_next).
+  query = db.session.query(Artist.id , Artist.name)
+  if letter == '#':
+    query = query.filter(~db.func.upper(db.func.substr(Artist.name , 1 , 1)).between('A' , 'Z'))
+  elif letter:
+    query = query.filter(Artist.name.ilike(letter + '%'))
+  rows = query.order_by(Artist.name , Artist.id)\
+    .offset((page - 1) * ARTISTS_PER_PAGE)\
+    .limit(ARTISTS_PER_PAGE + 1)\
+    .all()
+  return rows[:ARTISTS_PER_PAGE] , len(rows) > ARTISTS_PER_PAGE
+
+def show_counters(model , show_column , now):
+  # the values of the maintained show counters of model (Venue or Artist) , as correlated
+  # subqueries over show. show_column is Show.venue_id or Show.artist_id.
+  def shows(*condition):
+    return db.and_(show_column == model.id , *condition)
+  return {
+    'upcoming_shows_count' : db.select([db.func.count()]).where(shows(Show.start_time > now)).as_scalar(),
+    'past_shows_count' : db.select([db.func.count()]).where(shows(Show.start_time <= now)).as_scalar(),
+    'next_show_at' : db.select([db.func.min(Show.start_time)]).where(shows(Show.start_time > now)).as_scalar()
+  }
+
+def refresh_show_counts(model , show_column , condition=None , now=None):
+  # recomputes the counters of the venues / artists matching condition (all of them when
+  # it is None) with a single UPDATE. the caller commits.
+  # returns the number of updated rows.
+  query = model.query
+  if condition is not None:
+    query = query.filter(condition)
+  return query.update(show_counters(model , show_column , now or datetime.now()) , synchronize_session=False)
+
+def count_new_show(model , model_id , start_time , now=None):
+  # bumps the counters of one venue / artist for a show being added. it is an increment
+  # rather than a recount , so concurrent inserts of shows can not overwrite each other.
+  # the caller commits.
+  if start_time > (now or datetime.now()):
+    next_show_at = db.case([(db.or_(model.next_show_at == None , model.next_show_at > start_time) , start_time)] ,
+                           else_=model.next_show_at)
+    values = {'upcoming_shows_count' : model.upcoming_shows_count + 1 , 'next_show_at' : next_show_at}
+  else:
+    values = {'past_shows_count' : model.past_shows_count + 1}
+  model.query.filter(model.id == model_id).update(values , synchronize_session=False)
+  note_next_show(start_time , now)
+
+def roll_show_counts(now=None):
+  # moves the shows that started since the last roll from the upcoming to the past counters.
+  # only the venues / artists whose next show has started are recounted , the others are
+  # left alone so rolling often stays cheap. returns the number of updated rows.
+  now = now or datetime.now()
+  updated = 0
+  for model , show_column in ((Venue , Show.venue_id) , (Artist , Show.artist_id)):
+    updated += refresh_show_counts(model , show_column , model.next_show_at <= now , now)
+  db.session.commit()
+  return updated
+
+#the earliest next_show_at known to this process , see roll_due_show_counts
+show_counts_roll = {'due_at' : None}
+show_counts_roll_lock = threading.Lock()
+
+def earliest_next_show():
+  # the first next_show_at of the venues and artists , None without upcoming shows. two index lookups.
+  times = [db.session.query(db.func.min(model.next_show_at)).scalar() for model in (Venue , Artist)]
+  times = [value for value in times if value is not None]
+  return min(times) if times else None
+
+def note_next_show(start_time , now=None):
+  # a show was added by this process , the counters are due no later than its start.
+  if start_time > (now or datetime.now()):
+    due_at = show_counts_roll['due_at']
+    show_counts_roll['due_at'] = start_time if due_at is None else min(due_at , start_time)
+
+def roll_due_show_counts(now=None):
+  # called by the views reading the counters , rolls them once the earliest known next_show_at has passed.
+  # the check itself runs no query : the time comes from the rows of the /venues listing (a show counts for
+  # its venue and its artist , the earliest venue is the earliest of both) , from the shows this process adds
+  # and from the last roll. a roll updates the database , any worker rolling fixes the counters of all of them.
+  # returns True when the counters were rolled. a failed roll leaves them as they were , the next read retries.
+  now = now or datetime.now()
+  due_at = show_counts_roll['due_at']
+  if due_at is None or due_at > now:
+    return False
+  # one request of the process rolls , the others read the counters as they are
+  if not show_counts_roll_lock.acquire(blocking=False):
+    return False
+  try:
+    # the roll writes , and the time read after it must not come from a lagging replica
+    db.use_primary()
+    roll_show_counts(now)
+    show_counts_roll['due_at'] = earliest_next_show()
+    return True
+  except:
+    db.session.rollback()
+    print(exc_info())
+    return False
+  finally:
+    show_counts_roll_lock.release()
+
+def page_ttl(upcoming_shows , now=None):
+  # a detail page splits its shows in upcoming and past ones , it is only right until the next show starts.
+  if not upcoming_shows:
+    return None
+  next_show = min(show['start_time'] for show in upcoming_shows)
+  return (next_show - (now or datetime.now())).total_seconds()
+
+def detail_page(kind , entity_id , render):
+  # the cached {'name' , 'detail'} of a venue or artist page , render() builds it with its ttl on a miss.
+  # a miss renders from the primary , a lagging replica would cache the page from before the last write.
+  def render_from_primary():
+    db.use_primary()
+    return render()
+  return detail_pages.get('{}:{}'.format(kind , entity_id) , render_from_primary)
+
+def invalidate_detail_pages(venue_ids=() , artist_ids=()):
+  # drops the pages of the given venues and artists , called once the write that changes them is committed.
+  detail_pages.invalidate(*(['venue:{}'.format(venue_id) for venue_id in venue_ids] +
+                            ['artist:{}'.format(artist_id) for artist_id in artist_ids]))
+
+def invalidate_venue_pages(venue_id):
+  # a venue's page and the pages of the artists playing there , they list its name and image.
+  artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)]
+  invalidate_detail_pages([venue_id] , artist_ids)
+
+def invalidate_artist_pages(artist_id):
+  venue_ids = [venue_id for venue_id, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id)]
+  invalidate_detail_pages(venue_ids , [artist_id])
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+def venue_import_row(form):
+  return {
+    'name' : form.name.data,
+    'city' : form.city.data,
+    'state' : form.state.data,
+    'address' : form.address.data,
+    'phone' : form.phone.data,
+    'image_link' : form.image_link.data,
+    'facebook_link' : form.facebook_link.data,
+    'genres' : ','.join(form.genres.data),
+    'seeking_talent' : False,
+    'upcoming_shows_count' : 0,
+    'past_shows_count' : 0
+  }
+
+def artist_import_row(form):
+  return {
+    'name' : form.name.data,
+    'city' : form.city.data,
+    'state' : form.state.data,
+    'phone' : form.phone.data,
+    'image_link' : form.image_link.data,
+    'facebook_link' : form.facebook_link.data,
+    'genres' : ','.join(form.genres.data),
+    'seeking_venue' : False,
+    'upcoming_shows_count' : 0,
+    'past_shows_count' : 0
+  }
+
+def show_import_row(form):
+  # the ids are checked by check_show_import
+  def to_int(value):
+    try:
+      return int(value)
+    except (TypeError , ValueError):
+      return None
+  return {
+    'artist_id' : to_int(form.artist_id.data),
+    'venue_id' : to_int(form.venue_id.data),
+    'start_time' : form.start_time.data
+  }
+
+def check_show_import(rows):
+  # rejects the shows whose artist or venue does not exist , two queries per chunk.
+  venue_ids = set(values['venue_id'] for _ , values in rows if values['venue_id'] is not None)
+  artist_ids = set(values['artist_id'] for _ , values in rows if values['artist_id'] is not None)
+  known_venues = set(venue_id for venue_id, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids)))
+  known_artists = set(artist_id for artist_id, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids)))
+  rejected = {}
+  for row , values in rows:
+    errors = {}
+    if values['venue_id'] not in known_venues:
+      errors['venue_id'] = ['no venue with this id']
+    if values['artist_id'] not in known_artists:
+      errors['artist_id'] = ['no artist with this id']
+    if errors:
+      rejected[row] = errors
+  return rejected
+
+def count_imported_shows(rows):
+  # the counters of every venue and artist of the chunk are recounted , two updates per chunk.
+  venue_ids = set(values['venue_id'] for values in rows)
+  artist_ids = set(values['artist_id'] for values in rows)
+  refresh_show_counts(Venue , Show.venue_id , Venue.id.in_(venue_ids))
+  refresh_show_counts(Artist , Show.artist_id , Artist.id.in_(artist_ids))
+  for values in rows:
+    note_next_show(values['start_time'])
+  invalidate_detail_pages(venue_ids , artist_ids)
+
+IMPORTS = {
+  'venues' : ImportSpec(Venue , VenueForm , venue_import_row),
+  'artists' : ImportSpec(Artist , ArtistForm , artist_import_row , after_chunk=lambda rows: artist_pages.invalidate()),
+  'shows' : ImportSpec(Show , ShowForm , show_import_row , check=check_show_import , after_chunk=count_imported_shows)
+}
+
+def bulk_import(kind , stream , format , job=None , batch_size=BATCH_SIZE):
+  # imports a text stream of venues , artists or shows , returns the importer report.
+  importer = BulkImporter(db , IMPORTS[kind] , ImportCheckpoint , batch_size=batch_size)
+  report = importer.run(read_rows(stream , format) , job=job)
+  if kind == 'artists':
+    #the chunks invalidate before their commit , a page rendered in between must go too.
+    artist_pages.invalidate()
+  elif kind == 'shows':
+    #same for the venue and artist pages , the keys of every chunk are not kept so they all go.
+    detail_pages.clear()
+  return report
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -131,31 +456,9 @@ def venues():
   data=[]
 
   try:
-    #get all distinct locations
-    locations = db.session.query(Venue.city , Venue.state ).group_by(Venue.city , Venue.state).all()
-
-    #get venues for specific location
-    for city,state in locations :
-
-      venues_list=[]
-      location_venues=Venue.query.filter(Venue.city==city , Venue.state == state).all()
-      print(location_venues)
-
-      for location_venue in location_venues:
-        n_upcoming_shows = Show.query.filter(Show.venue_id == location_venue.id , Show.start_time > datetime.now()).count()
-        venues_dict = {
-          "id" : location_venue.id,
-          "name" : location_venue.name,
-          "num_upcoming_shows" : n_upcoming_shows
-        }
-        venues_list.append(venues_dict)
-
-      data.append({
-        "city" : city,
-        "state" : state,
-        "venues" : venues_list
-      })
-
+    data = venue_areas()
+    if roll_due_show_counts():
+      data = venue_areas()
   except:
     print(exc_info())
     abort(500)
@@ -169,13 +472,15 @@ def search_venues():
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   try:
     search_term = request.form.get('search_term', '')
-    search_result = Venue.query.filter( Venue.name.ilike("%"+search_term+"%")).all()
+    roll_due_show_counts()
+    search_result = db.session.query(Venue.id , Venue.name , Venue.upcoming_shows_count)\
+      .filter( Venue.name.ilike("%"+search_term+"%")).all()
     response_data=[]
     for result in search_result:
       response_data.append( {
         "id": result.id,
         "name" : result.name,
-        "num_upcoming_shows": Show.query.filter(Show.venue_id == result.id , Show.start_time > datetime.now()).count()
+        "num_upcoming_shows": result.upcoming_shows_count
       })
 
     response={
@@ -231,8 +536,7 @@ def show_venue(venue_id):
   #   "upcoming_shows_count": 1,
   # }
   #data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  data={}
-  try:
+  def render_venue():
     #return a list of tuples of the (Venue  , show object) since the venue is the same in all entries , I will use the first one to
     #populate artist info.
     join_venues_shows = db.session.query(Venue, Show).outerjoin(Show, Venue.id == Show.venue_id).filter(Venue.id == venue_id).all()
@@ -263,7 +567,7 @@ def show_venue(venue_id):
           'artist_id' : venue_show.artist.id,
           'artist_name' : venue_show.artist.name,
           'artist_image_link' : venue_show.artist.image_link,
-          'start_time': str(venue_show.start_time)
+          'start_time': venue_show.start_time
         }
       if venue_show.start_time > datetime.now():
         data['upcoming_shows_count']+=1
@@ -272,11 +576,16 @@ def show_venue(venue_id):
         data['past_shows_count']+=1
         data['past_shows'].append(show_artist_info)
 
+    page = {'name' : data['name'] , 'detail' : render_template('pages/venue_detail.html', venue=data)}
+    return page , page_ttl(data['upcoming_shows'])
+
+  try:
+    page = detail_page('venue' , venue_id , render_venue)
   except:
     print(exc_info())
     abort(500)
 
-  return render_template('pages/show_venue.html', venue=data)
+  return render_template('pages/show_venue.html', name=page['name'], detail=Markup(page['detail']))
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -328,8 +637,14 @@ def delete_venue(venue_id):
   error = False
   try:
     venue= db.session.query(Venue).filter(Venue.id==venue_id).first()
+    #the venue's shows go with it , so its artists have to be recounted
+    artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter(Show.venue_id==venue_id)]
     db.session.delete(venue)
+    db.session.flush()
+    if artist_ids:
+      refresh_show_counts(Artist , Show.artist_id , Artist.id.in_(artist_ids))
     db.session.commit()
+    invalidate_detail_pages([venue_id] , artist_ids)
   except:
     print(exc_info())
     error = True
@@ -361,19 +676,29 @@ def artists():
   #   "id": 6,
   #   "name": "The Wild Sax Band",
   # }]
-  data=[]
+  letter = request.args.get('letter', '').upper()
+  page = request.args.get('page', 1, type=int)
+  if page < 1 or (letter and letter not in ARTIST_INDEX):
+    abort(404)
+
+  def render_directory():
+    #from the primary like the venue and artist pages (see detail_page)
+    db.use_primary()
+    artists , has_next = artist_directory_page(letter , page)
+    if not artists and page > 1:
+      return None
+    return render_template('pages/artists_directory.html', artists=artists, index=ARTIST_INDEX,
+                           letter=letter, page=page, has_next=has_next)
+
   try:
-    artists = Artist.query.all()
-    for artist in artists:
-      data.append({
-        "id":artist.id,
-        "name": artist.name
-      })
+    directory = artist_pages.get((letter , page) , render_directory)
   except:
     print(exc_info())
     abort(500)
+  if directory is None:
+    abort(404)
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', directory=Markup(directory))
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -391,13 +716,15 @@ def search_artists():
 
   try:
     search_term = request.form.get('search_term', '')
-    search_result = Artist.query.filter( Artist.name.ilike("%"+search_term+"%")).all()
+    roll_due_show_counts()
+    search_result = db.session.query(Artist.id , Artist.name , Artist.upcoming_shows_count)\
+      .filter( Artist.name.ilike("%"+search_term+"%")).all()
     response_data=[]
     for result in search_result:
       response_data.append( {
         "id": result.id,
         "name" : result.name,
-        "num_upcoming_shows": Show.query.filter(Show.artist_id == result.id , Show.start_time > datetime.now()).count()
+        "num_upcoming_shows": result.upcoming_shows_count
       })
 
     response={
@@ -487,8 +814,7 @@ def show_artist(artist_id):
   #   "upcoming_shows_count": 3,
   # }
   #data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
-  data={}
-  try:
+  def render_artist():
     #return a list of tuples of the (Artist  , show object) since the arists is the same in all entries , I will use the first one to
     #populate artist info.
     join_artists_shows = db.session.query(Artist, Show).outerjoin(Show, Artist.id == Show.artist_id).filter(Artist.id == artist_id).all()
@@ -518,7 +844,7 @@ def show_artist(artist_id):
           'venue_id' : artist_show.venue.id,
           'venue_name' : artist_show.venue.name,
           'venue_image_link' : artist_show.venue.image_link,
-          'start_time': str(artist_show.start_time)
+          'start_time': artist_show.start_time
         }
       if artist_show.start_time > datetime.now():
         data['upcoming_shows_count']+=1
@@ -527,11 +853,16 @@ def show_artist(artist_id):
         data['past_shows_count']+=1
         data['past_shows'].append(show_venue_info)
 
+    page = {'name' : data['name'] , 'detail' : render_template('pages/artist_detail.html', artist=data)}
+    return page , page_ttl(data['upcoming_shows'])
+
+  try:
+    page = detail_page('artist' , artist_id , render_artist)
   except:
     print(exc_info())
     abort(500)
 
-  return render_template('pages/show_artist.html', artist=data)
+  return render_template('pages/show_artist.html', name=page['name'], detail=Markup(page['detail']))
 
 
 #  Update
@@ -577,6 +908,8 @@ def edit_artist_submission(artist_id):
     artist.image_link = artist_form.image_link.data
     db.session.add(artist)
     db.session.commit()
+    artist_pages.invalidate()
+    invalidate_artist_pages(artist_id)
   except:
     db.session.rollback()
     flash("failed to update artist's data")
@@ -628,6 +961,7 @@ def edit_venue_submission(venue_id):
     venue.image_link = venue_form.image_link.data
     db.session.add(venue)
     db.session.commit()
+    invalidate_venue_pages(venue_id)
   except:
     db.session.rollback()
     flash("failed to update venue's data")
@@ -667,6 +1001,7 @@ def create_artist_submission():
     )
     db.session.add(new_artist)
     db.session.commit()
+    artist_pages.invalidate()
   except:
     error=True
     db.session.rollback()
@@ -730,21 +1065,35 @@ def shows():
   #   "start_time": "2035-04-15T20:00:00.000Z"
   # }]
   data=[]
-  error = False 
+  page = request.args.get('page', 1, type=int)
+  if page < 1:
+    abort(404)
   try:
-    shows = Show.query.all()
-    for show in shows:      
-      data.append({'venue_id' : show.venue_id,
-                   'artist_id' : show.artist_id,
-                   'venue_name' : show.venue.name,
-                   'artist_name' : show.artist.name,
-                   'start_time' : str(show.start_time)
+    #one joined select of just the rendered columns , one page at a time ; reading
+    #show.venue / show.artist would lazy load two more rows for every show.
+    #one extra row is fetched to know whether there is a next page without a COUNT.
+    rows = db.session.query(Show.venue_id , Show.artist_id , Venue.name , Artist.name , Artist.image_link , Show.start_time)\
+      .join(Venue , Venue.id == Show.venue_id)\
+      .join(Artist , Artist.id == Show.artist_id)\
+      .order_by(Show.start_time , Show.venue_id , Show.artist_id)\
+      .offset((page - 1) * SHOWS_PER_PAGE)\
+      .limit(SHOWS_PER_PAGE + 1)\
+      .all()
+    for venue_id , artist_id , venue_name , artist_name , artist_image_link , start_time in rows[:SHOWS_PER_PAGE]:
+      data.append({'venue_id' : venue_id,
+                   'artist_id' : artist_id,
+                   'venue_name' : venue_name,
+                   'artist_name' : artist_name,
+                   'artist_image_link' : artist_image_link,
+                   'start_time' : start_time
 
           })
   except:
-    error=True
+    print(exc_info())
     abort(500)
-  return render_template('pages/shows.html', shows=data)
+  if not data and page > 1:
+    abort(404)
+  return render_template('pages/shows.html', shows=data, page=page, has_next=len(rows) > SHOWS_PER_PAGE)
 
 @app.route('/shows/create')
 def create_shows():
@@ -763,7 +1112,11 @@ def create_show_submission():
                   venue_id = show_form.venue_id.data,
                    start_time = show_form.start_time.data)
     db.session.add(new_show)
+    db.session.flush()
+    count_new_show(Venue , new_show.venue_id , new_show.start_time)
+    count_new_show(Artist , new_show.artist_id , new_show.start_time)
     db.session.commit()
+    invalidate_detail_pages([new_show.venue_id] , [new_show.artist_id])
   except:
     error=True
     db.session.rollback()
@@ -779,6 +1132,44 @@ def create_show_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
   return render_template('pages/home.html')
 
+@app.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+  # bulk import : the rows are sent as a 'file' upload or as the request body , in csv , json or
+  # jsonl (?format= , or guessed from the uploaded file name). pass ?job=<name> to be able to
+  # resume an interrupted import by sending the same file again with the same job name.
+  if kind not in IMPORTS:
+    abort(404)
+  upload = request.files.get('file')
+  format = request.args.get('format') or guess_format(upload.filename if upload else None)
+  if format not in FORMATS:
+    return jsonify({'success' : False , 'message' : 'format must be one of {}'.format(', '.join(FORMATS))}) , 400
+  stream = text_stream(upload.stream if upload else request.stream)
+  try:
+    report = bulk_import(kind , stream , format , job=request.args.get('job'))
+  except ValueError as error:
+    #a malformed file , the chunks before the error are committed
+    return jsonify({'success' : False , 'message' : 'could not read the file : {}'.format(error)}) , 400
+  except:
+    print(exc_info())
+    abort(500)
+  report['success'] = True
+  return jsonify(report)
+
+if app.config['PERF_ENDPOINT']:
+  @app.route('/debug/perf', methods=['GET'])
+  def get_perf():
+    # query counts and database time per route of the sampled requests and the slowest statements ,
+    # with the state of the connection pools (primary and replicas) of this worker
+    report = perf_monitor.report()
+    report['pool'] = pool_status(db.engine)
+    report['replica_pools'] = {key: pool_status(db.get_engine(app, key)) for key in db.replica_keys(app)}
+    return jsonify(report)
+
+  @app.route('/debug/perf', methods=['DELETE'])
+  def reset_perf():
+    perf_monitor.reset()
+    return jsonify({'success': True})
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -798,6 +1189,40 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Jobs.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('import-data')
+@click.argument('kind' , type=click.Choice(sorted(IMPORTS)))
+@click.argument('source' , type=click.File('rb'))
+@click.option('--format' , 'format' , type=click.Choice(FORMATS) , help='default : from the file extension')
+@click.option('--job' , help='name of the job , rerun with the same name to resume an interrupted import')
+@click.option('--batch-size' , default=BATCH_SIZE , show_default=True)
+def import_data_command(kind , source , format , job , batch_size):
+  # flask import-data shows shows.csv --job partner-2020 , use - as source to read stdin
+  format = format or guess_format(source.name)
+  if format is None:
+    raise click.UsageError('can not guess the format of {} , pass --format'.format(source.name))
+  report = bulk_import(kind , text_stream(source) , format , job=job , batch_size=batch_size)
+  for error in report['errors']:
+    print('row {row}: {errors}'.format(**error))
+  print('{} rows read , {} skipped (already imported) , {} imported , {} rejected'.format(
+    report['rows'] , report['resumed_after'] , report['imported'] , report['rejected']))
+
+@app.cli.command('roll-show-counts')
+def roll_show_counts_command():
+  # cron entry point : flask roll-show-counts
+  print('{} venues and artists recounted'.format(roll_show_counts()))
+
+@app.cli.command('rebuild-show-counts')
+def rebuild_show_counts_command():
+  # recounts every venue and artist , e.g. after writing to the show table outside of the app
+  now = datetime.now()
+  updated = refresh_show_counts(Venue , Show.venue_id , now=now) + refresh_show_counts(Artist , Show.artist_id , now=now)
+  db.session.commit()
+  print('{} venues and artists recounted'.format(updated))
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,310 @@
+#----------------------------------------------------------------------------#
+# Fyyur benchmarks.
+#
+# seeds a throw away sqlite database with synthetic venues , artists and shows
+# and drives the pages through the flask test client while counting every SQL
+# statement sent to the database.
+#
+#   python bench.py                       runs every benchmark with the default sizes
+#   python bench.py venues --sizes 10 1000
+#   DATABASE_URL=postgresql:///fyyur_bench python bench.py explain
+#----------------------------------------------------------------------------#
+
+import os
+import sys
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+#must be set before the app module reads config.py
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import babel.dates
+import dateutil.parser
+from sqlalchemy import event
+from app import app, db, Venue, Artist, Show, refresh_show_counts, artist_pages, detail_pages, format_datetime, DATETIME_FORMATS
+
+STATES = ['CA', 'NY', 'TX', 'WA', 'IL']
+
+
+@contextmanager
+def count_queries():
+  # yields a one element list holding the number of statements executed inside the block.
+  counter = [0]
+  def on_execute(conn, cursor, statement, parameters, context, executemany):
+    counter[0] += 1
+  event.listen(db.engine, 'before_cursor_execute', on_execute)
+  try:
+    yield counter
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', on_execute)
+
+
+def seed(n_venues, n_artists=None, shows_per_venue=3):
+  # recreates the schema with n_venues venues spread over n_venues/10 cities.
+  n_artists = n_artists or max(1, n_venues // 2)
+  db.drop_all()
+  if db.engine.dialect.name == 'postgresql':
+    #the name search indexes use the trigram operators
+    db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.session.commit()
+  db.create_all()
+  if db.engine.dialect.name != 'postgresql':
+    #elsewhere the trigram indexes degrade to plain indexes on name the migrations never create
+    for index in ('ix_venue_name_trgm', 'ix_artist_name_trgm'):
+      db.session.execute('DROP INDEX {}'.format(index))
+  now = datetime.now()
+  n_cities = max(1, n_venues // 10)
+  db.session.bulk_insert_mappings(Venue, [{
+    'id' : i + 1,
+    'name' : 'Venue Hall {}'.format(i),
+    'city' : 'City {}'.format(i % n_cities),
+    'state' : STATES[i % len(STATES)],
+    'genres' : 'Jazz,Folk'
+  } for i in range(n_venues)])
+  db.session.bulk_insert_mappings(Artist, [{
+    'id' : i + 1,
+    'name' : 'Artist {}'.format(i),
+    'city' : 'City {}'.format(i % n_cities),
+    'state' : STATES[i % len(STATES)],
+    'genres' : 'Jazz'
+  } for i in range(n_artists)])
+  #show's primary key is (artist_id , venue_id) so every venue gets distinct artists.
+  shows = []
+  for venue_id in range(1, n_venues + 1):
+    for artist_id in random.sample(range(1, n_artists + 1), min(shows_per_venue, n_artists)):
+      shows.append({
+        'venue_id' : venue_id,
+        'artist_id' : artist_id,
+        'start_time' : now + timedelta(days=random.randint(-60, 60))
+      })
+  db.session.bulk_insert_mappings(Show, shows)
+  #bulk inserts bypass the app , so the show counters are built once at the end.
+  refresh_show_counts(Venue, Show.venue_id)
+  refresh_show_counts(Artist, Show.artist_id)
+  db.session.commit()
+
+
+def bench_venues(sizes):
+  # the /venues page must cost the same number of queries whatever the catalog size.
+  client = app.test_client()
+  results = []
+  for size in sizes:
+    seed(size)
+    with count_queries() as queries:
+      res = client.get('/venues')
+    assert res.status_code == 200, res.status_code
+    results.append((size, queries[0]))
+    print('venues={:<8} queries={}'.format(size, queries[0]))
+
+  query_counts = set(count for _, count in results)
+  if len(query_counts) != 1:
+    print('FAIL: /venues query count grows with the number of venues')
+    return False
+  print('OK: /venues runs {} queries for every catalog size'.format(query_counts.pop()))
+  return True
+
+
+def bench_search(sizes):
+  # a broad search term matches every row , the query count must not follow the hit count.
+  client = app.test_client()
+  ok = True
+  for path in ('/venues/search', '/artists/search'):
+    query_counts = set()
+    for size in sizes:
+      seed(size)
+      with count_queries() as queries:
+        res = client.post(path, data={'search_term' : 'a'})
+      assert res.status_code == 200, res.status_code
+      query_counts.add(queries[0])
+      print('{:<16} rows={:<8} queries={}'.format(path, size, queries[0]))
+    if len(query_counts) != 1:
+      print('FAIL: {} query count grows with the number of results'.format(path))
+      ok = False
+  if ok:
+    print('OK: search query counts are independent of the number of results')
+  return ok
+
+
+def bench_shows(sizes):
+  # a page of /shows is one select no matter how many shows the table holds.
+  client = app.test_client()
+  query_counts = set()
+  for size in sizes:
+    seed(size)
+    with count_queries() as queries:
+      res = client.get('/shows')
+    assert res.status_code == 200, res.status_code
+    query_counts.add(queries[0])
+    print('shows={:<8} queries={}'.format(Show.query.count(), queries[0]))
+  if len(query_counts) != 1:
+    print('FAIL: /shows query count grows with the number of shows')
+    return False
+  print('OK: a page of /shows runs {} queries for every table size'.format(query_counts.pop()))
+  return True
+
+
+def bench_artists(sizes):
+  # a page of the artist directory is one select , then it is served from the fragment cache.
+  client = app.test_client()
+  query_counts = set()
+  for size in sizes:
+    seed(size, n_artists=size)
+    artist_pages.invalidate()
+    for attempt in ('cold', 'cached'):
+      with count_queries() as queries:
+        res = client.get('/artists')
+      assert res.status_code == 200, res.status_code
+      query_counts.add((attempt, queries[0]))
+      print('artists={:<8} {:<7} queries={}'.format(size, attempt, queries[0]))
+  if query_counts != {('cold', 1), ('cached', 0)}:
+    print('FAIL: a page of /artists must cost one query , and none once cached')
+    return False
+  print('OK: a page of /artists runs 1 query for every table size , 0 once cached')
+  return True
+
+
+def bench_pages(sizes):
+  # a venue or artist page is rendered once , served from the page cache until a new show drops it.
+  client = app.test_client()
+  ok = True
+  for size in sizes:
+    seed(size)
+    detail_pages.clear()
+    for path in ('/venues/1', '/artists/1'):
+      counts = []
+      for attempt in ('cold', 'cached'):
+        with count_queries() as queries:
+          res = client.get(path)
+        assert res.status_code == 200, res.status_code
+        counts.append(queries[0])
+        print('rows={:<8} {:<12} {:<7} queries={}'.format(size, path, attempt, queries[0]))
+      ok = ok and counts[0] > 0 and counts[1] == 0
+    #a new show drops the pages of its venue and artist , the next request renders them again
+    busy = db.session.query(Show.artist_id).filter(Show.venue_id == 1)
+    artist_id = db.session.query(Artist.id).filter(~Artist.id.in_(busy)).order_by(Artist.id).first()[0]
+    res = client.post('/shows/create', data={'venue_id' : 1, 'artist_id' : artist_id,
+                                             'start_time' : (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')})
+    assert res.status_code == 200, res.status_code
+    for path in ('/venues/1', '/artists/{}'.format(artist_id)):
+      with count_queries() as queries:
+        res = client.get(path)
+      print('rows={:<8} {:<12} {:<7} queries={}'.format(size, path, 'new show', queries[0]))
+      ok = ok and queries[0] > 0
+  if not ok:
+    print('FAIL: a cached page must cost no query and be rendered again after a write')
+    return False
+  print('OK: cached venue and artist pages cost no query and are dropped by a new show')
+  return True
+
+
+def bench_datetime(sizes):
+  # per row cost of the datetime filter against the old one , which formatted str(start_time)
+  # by parsing it back with dateutil and resolving the babel pattern on every call.
+  def old_filter(value, format):
+    return babel.dates.format_datetime(dateutil.parser.parse(value), DATETIME_FORMATS[format])
+
+  now = datetime.now()
+  ok = True
+  for size in sizes:
+    times = [now + timedelta(minutes=7 * i) for i in range(size)]
+    for format in ('full', 'medium'):
+      started = time.perf_counter()
+      old = [old_filter(str(value), format) for value in times]
+      old_us = 1e6 * (time.perf_counter() - started) / size
+      started = time.perf_counter()
+      new = [format_datetime(value, format) for value in times]
+      new_us = 1e6 * (time.perf_counter() - started) / size
+      same = old == new
+      ok = ok and same and new_us < old_us
+      print('rows={:<8} {:<7} before={:8.2f} us/row  after={:8.2f} us/row  x{:.1f}{}'.format(
+        size, format, old_us, new_us, old_us / new_us, '' if same else '  OUTPUT DIFFERS'))
+  print('OK: the datetime filter is faster and renders the same text' if ok
+        else 'FAIL: the datetime filter is slower or renders another text')
+  return ok
+
+
+def explain(query):
+  # the plan of a query as one string , from EXPLAIN QUERY PLAN on sqlite and EXPLAIN on postgres.
+  compiled = query.statement.compile(dialect=db.engine.dialect)
+  if compiled.positional:
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+  else:
+    params = compiled.params
+  prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+  with db.engine.connect() as conn:
+    if db.engine.dialect.name == 'postgresql':
+      # the seeded tables are small enough for the planner to prefer a sequential scan ,
+      # the question here is whether an index can serve the query at all.
+      conn.execute('SET enable_seqscan = off')
+    rows = conn.execute(prefix + str(compiled), params).fetchall()
+  return '\n'.join(str(row[-1]) for row in rows)
+
+
+def bench_explain(sizes):
+  # every hot access path must be served by its index (migration c3a8f5e21b7d).
+  seed(sizes[0])
+  now = datetime.now()
+  checks = [
+    ('shows of a venue', 'ix_show_venue_id_start_time',
+      Show.query.filter(Show.venue_id == 1 , Show.start_time > now)),
+    ('shows of an artist', 'ix_show_artist_id_start_time',
+      Show.query.filter(Show.artist_id == 1 , Show.start_time > now)),
+    ('venues by area', 'ix_venue_city_state_id',
+      db.session.query(Venue.city , Venue.state , Venue.id).order_by(Venue.city , Venue.state , Venue.id)),
+    ('artist directory', 'ix_artist_name_id',
+      db.session.query(Artist.id , Artist.name).order_by(Artist.name , Artist.id)),
+    ('show counters to roll', 'ix_venue_next_show_at',
+      Venue.query.filter(Venue.next_show_at <= now)),
+  ]
+  if db.engine.dialect.name == 'postgresql':
+    #sqlite can not use an index for a LIKE with a leading wildcard.
+    checks += [
+      ('venue search', 'ix_venue_name_trgm', Venue.query.filter(Venue.name.ilike('%hall 1%'))),
+      ('artist search', 'ix_artist_name_trgm', Artist.query.filter(Artist.name.ilike('%artist 1%'))),
+    ]
+  ok = True
+  for name, index, query in checks:
+    plan = explain(query)
+    used = index in plan
+    ok = ok and used
+    print('{:<24} {:<30} {}'.format(name, index, 'used' if used else 'NOT USED'))
+    if not used:
+      print('  ' + plan.replace('\n', '\n  '))
+  print('OK: every hot query uses its index' if ok else 'FAIL: some hot queries do not use their index')
+  return ok
+
+
+BENCHMARKS = {
+  'venues' : bench_venues,
+  'search' : bench_search,
+  'shows' : bench_shows,
+  'artists' : bench_artists,
+  'pages' : bench_pages,
+  'datetime' : bench_datetime,
+  'explain' : bench_explain,
+}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Fyyur benchmarks')
+  parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                      help='any of : {} (default : all)'.format(', '.join(BENCHMARKS)))
+  parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000])
+  args = parser.parse_args(argv)
+  unknown = set(args.benchmarks) - set(BENCHMARKS)
+  if unknown:
+    parser.error('unknown benchmark(s) : {}'.format(', '.join(sorted(unknown))))
+
+  ok = True
+  with app.app_context():
+    for name in args.benchmarks or list(BENCHMARKS):
+      print('== {}'.format(name))
+      ok = BENCHMARKS[name](args.sizes) and ok
+  return 0 if ok else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,201 @@
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+  '''
+  bounded LRU of rendered template fragments , e.g. the pages of the artist directory
+  a fragment is rendered once and served from memory until invalidate() is called after a write
+  that changes it , or until it is older than ttl seconds. the ttl bounds how long the other
+  worker processes , which do not see the invalidations of this one , can serve a stale fragment.
+  @param max_entries : how many fragments are kept , the least recently used ones are dropped first
+  @param ttl : maximum age of a fragment in seconds , None to rely on invalidate() only
+  '''
+  def __init__(self, max_entries=256, ttl=None):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.generation = 0
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key, render):
+    '''
+    @return the fragment cached under key , render() is called to produce it when it is missing or stale
+    '''
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+      self.misses += 1
+      generation = self.generation
+
+    fragment = render()
+    with self.lock:
+      # a write that happened while rendering must not be hidden behind the fragment rendered before it.
+      if generation == self.generation:
+        self.entries[key] = (fragment, time.monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+          self.entries.popitem(last=False)
+    return fragment
+
+  def invalidate(self):
+    with self.lock:
+      self.generation += 1
+      self.entries.clear()
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'entries': len(self.entries)
+    }
+
+
+class LRUStore:
+  '''
+  in process store of a PageCache , a bounded LRU whose entries expire on their own ttl
+  every worker process keeps its own copy , the invalidations of one worker do not reach the others.
+  @param max_entries : how many pages are kept , the least recently used ones are dropped first
+  '''
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      if time.monotonic() >= entry[1]:
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return entry[0]
+
+  def set(self, key, value, ttl):
+    with self.lock:
+      self.entries[key] = (value, time.monotonic() + ttl)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def delete(self, keys):
+    with self.lock:
+      for key in keys:
+        self.entries.pop(key, None)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  def __len__(self):
+    return len(self.entries)
+
+
+class RedisStore:
+  '''
+  shared store of a PageCache , a redis server (or any local server speaking its protocol) seen by
+  every worker , so an invalidation in one of them reaches all of them. needs the redis package.
+  @param url : e.g. redis://localhost:6379/0
+  @param prefix : prepended to every key , clear() only drops the keys under it
+  '''
+  def __init__(self, url, prefix='fyyur:page:'):
+    try:
+      import redis
+    except ImportError:
+      raise RuntimeError('a redis:// page cache needs the redis package , pip install redis')
+    self.client = redis.Redis.from_url(url)
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return None if value is None else json.loads(value)
+
+  def set(self, key, value, ttl):
+    # redis expiries are whole seconds , rounded up so a page never lives past its ttl by less than one.
+    self.client.setex(self.prefix + key, max(1, int(math.ceil(ttl))), json.dumps(value))
+
+  def delete(self, keys):
+    if keys:
+      self.client.delete(*[self.prefix + key for key in keys])
+
+  def clear(self):
+    keys = list(self.client.scan_iter(match=self.prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+  def __len__(self):
+    return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*'))
+
+
+def page_store(url, max_entries=1024):
+  # the store of a PageCache from the PAGE_CACHE_URL setting : redis://... or empty for the in process LRU.
+  if url:
+    return RedisStore(url)
+  return LRUStore(max_entries)
+
+
+class PageCache:
+  '''
+  rendered pages keyed by the entity they show , e.g. 'venue:12'
+  a page is rendered once and served from the store until one of its keys is invalidated by a write ,
+  or until its ttl is over. the render function picks the ttl of every page , e.g. the time left
+  before its next show moves from the upcoming shows to the past ones , capped by max_ttl.
+  @param store : an LRUStore or a RedisStore
+  @param max_ttl : the longest a page is kept in seconds , it also bounds how long the other workers
+         can serve a stale page when the store is not shared
+  '''
+  def __init__(self, store, max_ttl=300):
+    self.store = store
+    self.max_ttl = max_ttl
+    self.generation = 0
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key, render):
+    '''
+    @param render : called on a miss , returns (page , ttl in seconds or None for max_ttl) , a None page is not cached
+    @return the page cached under key
+    '''
+    page = self.store.get(key)
+    with self.lock:
+      if page is not None:
+        self.hits += 1
+        return page
+      self.misses += 1
+      generation = self.generation
+
+    page , ttl = render()
+    ttl = self.max_ttl if ttl is None else min(ttl, self.max_ttl)
+    with self.lock:
+      # a write invalidated while rendering , the page may hold the data from before it.
+      if page is not None and ttl > 0 and generation == self.generation:
+        self.store.set(key, page, ttl)
+    return page
+
+  def invalidate(self, *keys):
+    with self.lock:
+      self.generation += 1
+    self.store.delete(keys)
+
+  def clear(self):
+    with self.lock:
+      self.generation += 1
+    self.store.clear()
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'entries': len(self.store)
+    }
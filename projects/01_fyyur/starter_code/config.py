@@ -1,4 +1,6 @@
 import os , flask_sqlalchemy
+from pool import engine_options
+from routing import replica_binds
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -11,5 +13,33 @@ DEBUG = True
 
 # TODO_DONE IMPLEMENT DATABASE URL
 ##using unix domain sockets , refrence : https://stackoverflow.com/questions/23839656/sqlalchemy-no-password-supplied-error
-SQLALCHEMY_DATABASE_URI =  'postgresql:///fyyurapp'
+SQLALCHEMY_DATABASE_URI =  os.environ.get('DATABASE_URL', 'postgresql:///fyyurapp')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# pool size , overflow , timeouts ... from the DB_* environment variables (see pool.py)
+SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+# Read replicas (see routing.py).
+# the pages and searches read from DATABASE_REPLICA_URLS when set , a client that just wrote
+# reads from the primary for DB_PRIMARY_PIN_SECONDS
+SQLALCHEMY_BINDS = replica_binds()
+DB_PRIMARY_PIN_SECONDS = float(os.environ.get('DB_PRIMARY_PIN_SECONDS', 5))
+
+# Per request SQL instrumentation (see perf.py).
+# fraction of the requests whose statements are counted and timed , 0 turns it off
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 0))
+PERF_SLOW_QUERY_MS = float(os.environ.get('PERF_SLOW_QUERY_MS', 100))
+# serve the aggregated measures on /debug/perf , keep it off on public deployments
+PERF_ENDPOINT = os.environ.get('PERF_ENDPOINT', '') == '1'
+
+# Artist directory cache.
+# how many rendered pages of /artists are kept and for how many seconds , the other
+# workers do not see the invalidations of the one handling a write before that
+ARTIST_PAGES_CACHE_SIZE = int(os.environ.get('ARTIST_PAGES_CACHE_SIZE', 256))
+ARTIST_PAGES_CACHE_TTL = float(os.environ.get('ARTIST_PAGES_CACHE_TTL', 60))
+
+# Venue and artist page cache.
+# '' keeps the rendered pages in every worker process , redis://localhost:6379/0 shares them
+PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL', '')
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 1024))
+# the longest a page is kept in seconds , pages with upcoming shows expire when the next one starts
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 300))
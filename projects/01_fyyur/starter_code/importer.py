@@ -0,0 +1,199 @@
+#----------------------------------------------------------------------------#
+# Bulk importer.
+#
+# streams venues , artists or shows from a csv / json file , validates every
+# row with the same form as the create pages and inserts the valid ones in
+# chunks of one executemany each. a bad row is reported and skipped , it does
+# not abort its chunk. every chunk is committed together with a checkpoint of
+# the rows done so far , an interrupted import resumes after the last
+# committed chunk when it is run again with the same job name.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError, DataError
+from werkzeug.datastructures import MultiDict
+from wtforms import SelectMultipleField
+
+#errors of the database that only concern the rows refused , a lost connection still aborts the import
+ROW_ERRORS = (IntegrityError, DataError)
+
+#rows validated and inserted together
+BATCH_SIZE = 1000
+#errors kept in the report , the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'json', 'jsonl')
+
+
+def guess_format(filename):
+  # csv , json or jsonl from a file name , None when the extension is unknown.
+  extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+  if extension == 'ndjson':
+    return 'jsonl'
+  return extension if extension in FORMATS else None
+
+
+def read_rows(stream, format):
+  # yields the rows of a text stream as dicts.
+  # csv has a header line , json is an array of objects (loaded at once) and jsonl holds
+  # one object per line (streamed , prefer it over json for large files).
+  # a file that can not be parsed raises ValueError.
+  if format == 'csv':
+    try:
+      for row in csv.DictReader(stream):
+        yield row
+    except csv.Error as error:
+      raise ValueError(str(error))
+  elif format == 'json':
+    rows = json.load(stream)
+    if not isinstance(rows, list):
+      raise ValueError('a json file must hold an array of objects , not a {}'.format(type(rows).__name__))
+    for row in rows:
+      yield row
+  elif format == 'jsonl':
+    for line in stream:
+      if line.strip():
+        yield json.loads(line)
+  else:
+    raise ValueError('unknown format {}'.format(format))
+
+
+def text_stream(binary_stream):
+  # an uploaded file or sys.stdin.buffer as text , without reading it all in memory.
+  return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+def to_formdata(raw, form_class):
+  # the form data of one row. multiple choice fields (genres) accept a list or a comma
+  # separated string , every other value is sent as a string like a browser would.
+  formdata = MultiDict()
+  for name, value in raw.items():
+    if value is None:
+      continue
+    field = getattr(form_class, name, None)
+    if getattr(field, 'field_class', None) is SelectMultipleField:
+      values = value if isinstance(value, list) else [part.strip() for part in str(value).split(',') if part.strip()]
+      for part in values:
+        formdata.add(name, part)
+    else:
+      formdata.add(name, value if isinstance(value, str) else str(value))
+  return formdata
+
+
+class ImportSpec:
+  '''
+  what to import and how
+  @param model : the model the rows are inserted into
+  @param form : the form class validating a row
+  @param to_row : builds the column values of the table from a validated form
+  @param check : optional , called with the [(row , values)] of a chunk that passed the form ,
+         returns {row: error} for the rows to reject , e.g. unknown foreign keys
+  @param after_chunk : optional , called with the inserted values of a chunk before it is committed
+  '''
+  def __init__(self, model, form, to_row, check=None, after_chunk=None):
+    self.model = model
+    self.form = form
+    self.to_row = to_row
+    self.check = check
+    self.after_chunk = after_chunk
+
+
+class BulkImporter:
+  '''
+  @param db : the flask_sqlalchemy object
+  @param spec : an ImportSpec
+  @param checkpoint_model : model with job , rows_done and updated_at columns storing the progress of named jobs
+  '''
+  def __init__(self, db, spec, checkpoint_model, batch_size=BATCH_SIZE):
+    self.db = db
+    self.spec = spec
+    self.checkpoint_model = checkpoint_model
+    self.batch_size = batch_size
+
+  def rows_done(self, job):
+    if job is None:
+      return 0
+    checkpoint = self.checkpoint_model.query.get(job)
+    return checkpoint.rows_done if checkpoint else 0
+
+  def run(self, rows, job=None):
+    '''
+    imports an iterable of dict rows , the rows already committed by an earlier run of job are skipped
+    @return the report {'job', 'resumed_after', 'rows', 'imported', 'rejected', 'errors': [{'row', 'errors'}]}
+    '''
+    report = {
+      'job': job,
+      'resumed_after': self.rows_done(job),
+      'rows': 0,
+      'imported': 0,
+      'rejected': 0,
+      'errors': []
+    }
+    chunk = []
+    for row, raw in enumerate(rows, start=1):
+      report['rows'] = row
+      if row <= report['resumed_after']:
+        continue
+      chunk.append((row, raw))
+      if len(chunk) >= self.batch_size:
+        self.import_chunk(chunk, job, report)
+        chunk = []
+    if chunk:
+      self.import_chunk(chunk, job, report)
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
+
+  def reject(self, report, row, errors):
+    report['rejected'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+      report['errors'].append({'row': row, 'errors': errors})
+
+  def import_chunk(self, chunk, job, report):
+    session = self.db.session
+    valid = []
+    for row, raw in chunk:
+      if not isinstance(raw, dict):
+        self.reject(report, row, {'row': ['not an object']})
+        continue
+      form = self.spec.form(formdata=to_formdata(raw, self.spec.form), meta={'csrf': False})
+      if form.validate():
+        valid.append((row, self.spec.to_row(form)))
+      else:
+        self.reject(report, row, form.errors)
+    if valid and self.spec.check:
+      rejected = self.spec.check(valid)
+      for row, error in sorted(rejected.items()):
+        self.reject(report, row, error)
+      valid = [(row, values) for row, values in valid if row not in rejected]
+
+    table = self.spec.model.__table__
+    inserted = []
+    try:
+      if valid:
+        try:
+          with session.begin_nested():
+            # a single executemany for the whole chunk
+            session.execute(table.insert(), [values for _, values in valid])
+          inserted = [values for _, values in valid]
+        except ROW_ERRORS:
+          # some row is refused by the database (e.g. a show that already exists , or a value longer than
+          # its column the forms do not check) , find it one savepoint per row.
+          for row, values in valid:
+            try:
+              with session.begin_nested():
+                session.execute(table.insert(), values)
+              inserted.append(values)
+            except ROW_ERRORS as error:
+              self.reject(report, row, {'row': [str(error.orig).strip()]})
+      if inserted and self.spec.after_chunk:
+        self.spec.after_chunk(inserted)
+      if job is not None:
+        session.merge(self.checkpoint_model(job=job, rows_done=chunk[-1][0], updated_at=datetime.now()))
+      session.commit()
+    except:
+      session.rollback()
+      raise
+    report['imported'] += len(inserted)
@@ -0,0 +1,42 @@
+"""show counters on venue and artist
+
+Revision ID: b7e2c4d19a5f
+Revises: 97770af6b246
+Create Date: 2026-10-18 18:02:11.412506
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4d19a5f'
+down_revision = '97770af6b246'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, show_column in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.create_index(op.f('ix_{}_next_show_at'.format(table)), table, ['next_show_at'], unique=False)
+        # backfill , the same counts as app.refresh_show_counts
+        op.execute("""
+            UPDATE {table} SET
+              upcoming_shows_count = (SELECT count(*) FROM show
+                                      WHERE show.{column} = {table}.id AND show.start_time > now()),
+              past_shows_count = (SELECT count(*) FROM show
+                                  WHERE show.{column} = {table}.id AND show.start_time <= now()),
+              next_show_at = (SELECT min(show.start_time) FROM show
+                              WHERE show.{column} = {table}.id AND show.start_time > now())
+        """.format(table=table, column=show_column))
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index(op.f('ix_{}_next_show_at'.format(table)), table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
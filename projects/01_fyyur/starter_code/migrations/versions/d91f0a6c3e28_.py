@@ -0,0 +1,25 @@
+"""artist directory index
+
+Revision ID: d91f0a6c3e28
+Revises: c3a8f5e21b7d
+Create Date: 2026-10-18 19:12:48.220731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f0a6c3e28'
+down_revision = 'c3a8f5e21b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the /artists directory pages are read in (name, id) order
+    op.create_index('ix_artist_name_id', 'artist', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_id', table_name='artist')
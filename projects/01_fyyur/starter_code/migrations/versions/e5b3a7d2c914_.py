@@ -0,0 +1,29 @@
+"""bulk import checkpoints
+
+Revision ID: e5b3a7d2c914
+Revises: d91f0a6c3e28
+Create Date: 2026-10-18 19:55:03.518842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b3a7d2c914'
+down_revision = 'd91f0a6c3e28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_checkpoint',
+    sa.Column('job', sa.String(length=200), nullable=False),
+    sa.Column('rows_done', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('job')
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoint')
@@ -0,0 +1,123 @@
+#----------------------------------------------------------------------------#
+# Read replicas.
+#
+# the read only requests are answered from a replica of the database , the others from the primary :
+#
+#   DATABASE_REPLICA_URLS    comma separated urls of the replicas , empty for none ('')
+#   DB_PRIMARY_PIN_SECONDS   seconds a client reads from the primary after a write (5)
+#
+# a request is read only when its method is GET, HEAD or OPTIONS , or when its endpoint was
+# registered with RoutingSQLAlchemy.read_only (the searches are POSTs that only read).
+# each read only request picks one replica and runs all its statements there , unless :
+#   - the session flushes , the flush and every later statement of the request go to the primary
+#   - the client wrote less than DB_PRIMARY_PIN_SECONDS ago , a successful write request sets a
+#     cookie that pins the following requests of the client to the primary so it reads its own writes
+# outside of a request (cli commands , startup) everything runs on the primary.
+#
+# every project is deployed on its own , so fyyur , trivia and the coffee shop each carry a copy of
+# this module. the trivia tests check that the copies keep the same code.
+#----------------------------------------------------------------------------#
+
+import os
+import time
+import random
+from flask import g, request, current_app, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+
+REPLICA_PREFIX = 'replica_'
+PIN_COOKIE = 'db_primary_until'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_binds(env=os.environ):
+  '''
+  @return the SQLALCHEMY_BINDS of the replicas listed in DATABASE_REPLICA_URLS
+  '''
+  urls = [url.strip() for url in env.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+  return {'{}{}'.format(REPLICA_PREFIX, index): url for index, url in enumerate(urls)}
+
+
+class RoutingSession(SignallingSession):
+  '''
+  session whose statements run on the replica chosen for the request (see RoutingSQLAlchemy.replica)
+  '''
+  def __init__(self, db, **options):
+    self.db = db
+    super().__init__(db, **options)
+
+  def get_bind(self, mapper=None, clause=None):
+    if self._flushing:
+      # the request wrote , it reads its own writes from the primary until it ends
+      if has_request_context():
+        g.db_wrote = True
+    else:
+      replica = self.db.replica()
+      if replica is not None:
+        return replica
+    return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  '''
+  SQLAlchemy service that sends the read only requests to the replicas of SQLALCHEMY_BINDS
+  (the binds named replica_<n>) , without replicas it behaves as SQLAlchemy
+  '''
+  def __init__(self, *args, **kwargs):
+    self.read_only_endpoints = set()
+    super().__init__(*args, **kwargs)
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def init_app(self, app):
+    app.config.setdefault('DB_PRIMARY_PIN_SECONDS', float(os.environ.get('DB_PRIMARY_PIN_SECONDS', 5)))
+    super().init_app(app)
+    app.after_request(self.pin_writes)
+
+  def read_only(self, *endpoints):
+    '''
+    marks endpoints that only read although their method is not a GET
+    @param endpoints : endpoint names (the view function names)
+    '''
+    self.read_only_endpoints.update(endpoints)
+
+  def replica_keys(self, app):
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or () if key.startswith(REPLICA_PREFIX))
+
+  def writes(self):
+    '''
+    @return True when the current request may write
+    '''
+    return request.method not in READ_METHODS and request.endpoint not in self.read_only_endpoints
+
+  def replica(self):
+    '''
+    @return the replica engine of the current request , None when it has to run on the primary
+    '''
+    if not has_request_context() or self.writes() or g.get('db_wrote') or g.get('db_primary'):
+      return None
+    if 'db_replica' not in g:
+      app = current_app._get_current_object()
+      keys = self.replica_keys(app)
+      pinned_until = request.cookies.get(PIN_COOKIE, 0, type=float)
+      g.db_replica = (self.get_engine(app, random.choice(keys))
+                      if keys and pinned_until < time.time() else None)
+    return g.db_replica
+
+  def use_primary(self):
+    '''
+    runs the rest of the current request on the primary , for the reads that fill a cache invalidated
+    by the writes : from a lagging replica they would put back what the write just invalidated
+    '''
+    if has_request_context():
+      g.db_primary = True
+
+  def pin_writes(self, response):
+    '''
+    after_request hook , pins the client to the primary after a successful write
+    '''
+    if response.status_code < 400 and self.replica_keys(current_app) and (self.writes() or g.get('db_wrote')):
+      seconds = current_app.config['DB_PRIMARY_PIN_SECONDS']
+      response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=int(seconds) + 1, httponly=True)
+    return response
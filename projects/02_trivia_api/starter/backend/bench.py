@@ -0,0 +1,200 @@
+'''
+Trivia API benchmarks
+
+seeds a throw away sqlite database with synthetic questions and drives the
+endpoints through the flask test client.
+
+  python bench.py                          runs every benchmark
+  python bench.py quiz --sizes 100 2000    plays whole games over categories of that size
+  python bench.py session                  the same games with server side quiz sessions
+'''
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import tempfile
+
+from flaskr import create_app, category_cache
+from models import db, Question, Category, notify_question_listeners
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+
+
+def make_app(database_path=None):
+  '''
+  creates the app on a fresh sqlite file unless a database path is given , the file is deleted on exit
+  '''
+  if database_path is None:
+    handle, filename = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    atexit.register(os.remove, filename)
+    database_path = 'sqlite:///{}'.format(filename)
+  return create_app({'SQLALCHEMY_DATABASE_URI': database_path})
+
+
+def seed(questions_per_category):
+  '''
+  replaces every question and category with questions_per_category questions in each category
+  '''
+  db.session.query(Question).delete()
+  db.session.query(Category).delete()
+  db.session.bulk_insert_mappings(Category, [
+    {'id': cat_id, 'type': cat_type} for cat_id, cat_type in enumerate(CATEGORIES, start=1)])
+  db.session.bulk_insert_mappings(Question, [{
+    'question': 'Question {} of category {}?'.format(i, cat_id),
+    'answer': 'Answer {}'.format(i),
+    'category': cat_id,
+    'difficulty': 1 + i % 5
+  } for cat_id in range(1, len(CATEGORIES) + 1) for i in range(questions_per_category)])
+  db.session.commit()
+  # the bulk writes go around the question listeners and the category cache , reload them like a bulk import.
+  category_cache.invalidate()
+  notify_question_listeners('reset', [])
+
+
+def percentile(samples, fraction):
+  ordered = sorted(samples)
+  return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def play_game(client, cat_id, previous_questions=None):
+  '''
+  plays until the quiz runs out of questions
+  @return (list of drawn ids , list of per turn latencies in seconds)
+  '''
+  previous_questions = list(previous_questions or [])
+  drawn = []
+  latencies = []
+  while True:
+    start = time.perf_counter()
+    res = client.post('/quizzes', json={
+      'previous_questions': previous_questions + drawn,
+      'quiz_category': {'type': 'bench', 'id': str(cat_id)}
+    })
+    latencies.append(time.perf_counter() - start)
+    data = json.loads(res.data)
+    assert res.status_code == 200, res.status_code
+    if data['question'] is None:
+      return drawn, latencies
+    drawn.append(data['question']['id'])
+
+
+def bench_quiz(app, sizes):
+  '''
+  plays a whole game in a single category and in "all" for every size , every question
+  must come up exactly once and the game must end even when previous_questions holds
+  ids from other categories.
+  '''
+  client = app.test_client()
+  ok = True
+  for size in sizes:
+    seed(size)
+    for cat_id, expected in ((1, size), (0, size * len(CATEGORIES))):
+      drawn, latencies = play_game(client, cat_id)
+      if len(drawn) != expected or len(set(drawn)) != expected:
+        print('FAIL: category {} drew {} unique of {} questions'.format(cat_id, len(set(drawn)), expected))
+        ok = False
+      print('category={} questions={:<7} turns={:<7} total={:8.3f}s mean={:7.3f}ms p95={:7.3f}ms last={:7.3f}ms'.format(
+        cat_id, expected, len(latencies), sum(latencies), 1000 * sum(latencies) / len(latencies),
+        1000 * percentile(latencies, 0.95), 1000 * latencies[-2]))
+
+    foreign = [q_id for q_id, in db.session.query(Question.id).filter(Question.category == 2)]
+    drawn, _ = play_game(client, 1, previous_questions=foreign)
+    if len(drawn) != size:
+      print('FAIL: previous questions from another category changed the game length')
+      ok = False
+  if ok:
+    print('OK: every game drew each question once and terminated')
+  return ok
+
+
+def bench_session(app, sizes):
+  '''
+  plays the games of bench_quiz with server side sessions , the request size stays constant
+  where the previous_questions of the default protocol grow with every turn.
+  '''
+  client = app.test_client()
+  ok = True
+  for size in sizes:
+    seed(size)
+    for cat_id, expected in ((1, size), (0, size * len(CATEGORIES))):
+      drawn = []
+      latencies = []
+      body = {'previous_questions': [], 'quiz_category': {'type': 'bench', 'id': str(cat_id)}, 'session': True}
+      request_bytes = 0
+      while True:
+        payload = json.dumps(body)
+        request_bytes += len(payload)
+        start = time.perf_counter()
+        res = client.post('/quizzes', data=payload, content_type='application/json')
+        latencies.append(time.perf_counter() - start)
+        data = json.loads(res.data)
+        assert res.status_code == 200, res.status_code
+        if data['question'] is None:
+          break
+        drawn.append(data['question']['id'])
+        body = {'session': data['session']}
+      if len(drawn) != expected or len(set(drawn)) != expected:
+        print('FAIL: category {} drew {} unique of {} questions'.format(cat_id, len(set(drawn)), expected))
+        ok = False
+      print('category={} questions={:<7} turns={:<7} total={:8.3f}s mean={:7.3f}ms p95={:7.3f}ms request bytes={}'.format(
+        cat_id, expected, len(latencies), sum(latencies), 1000 * sum(latencies) / len(latencies),
+        1000 * percentile(latencies, 0.95), request_bytes))
+  if ok:
+    print('OK: every session drew each question once and terminated')
+  return ok
+
+
+def bench_search(app, sizes):
+  '''
+  searches for words of varying selectivity , latency should not follow the size of the bank
+  '''
+  client = app.test_client()
+  for size in sizes:
+    seed(size)
+    for term in ('question 777', 'estio', 'category', 'answer', 'nomatch'):
+      latencies = []
+      for _ in range(20):
+        start = time.perf_counter()
+        res = client.post('/questions', json={'searchTerm': term})
+        latencies.append(time.perf_counter() - start)
+        assert res.status_code == 200, res.status_code
+      print('questions={:<8} term={:<16} hits={:<8} mean={:7.3f}ms p95={:7.3f}ms'.format(
+        size * len(CATEGORIES), repr(term), json.loads(res.data)['total_questions'],
+        1000 * sum(latencies) / len(latencies), 1000 * percentile(latencies, 0.95)))
+  return True
+
+
+BENCHMARKS = {
+  'quiz': bench_quiz,
+  'session': bench_session,
+  'search': bench_search,
+}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Trivia API benchmarks')
+  parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                      help='any of : {} (default : all)'.format(', '.join(BENCHMARKS)))
+  parser.add_argument('--sizes', nargs='+', type=int, default=[100, 500],
+                      help='questions per category')
+  parser.add_argument('--database', default=None,
+                      help='database url , defaults to a temporary sqlite file. its tables are overwritten!')
+  args = parser.parse_args(argv)
+  unknown = set(args.benchmarks) - set(BENCHMARKS)
+  if unknown:
+    parser.error('unknown benchmark(s) : {}'.format(', '.join(sorted(unknown))))
+
+  app = make_app(args.database)
+  ok = True
+  with app.app_context():
+    for name in args.benchmarks or list(BENCHMARKS):
+      print('== {}'.format(name))
+      ok = BENCHMARKS[name](app, args.sizes) and ok
+  return 0 if ok else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,28 +1,44 @@
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from sys import exc_info
-import random
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, question_listeners
+from pool import pool_status
 from werkzeug.exceptions import NotFound , InternalServerError , UnprocessableEntity
+from .cache import CategoryCache , FileVersion
+from .search import QuestionSearch
+from .perf import PerfMonitor
+from .http_cache import HttpCache
+from .quiz import QuestionIndex, QuizSessions
+from . import bulk
 QUESTIONS_PER_PAGE = 10
+#seconds before the cached category map is reloaded , overridable with the CATEGORY_CACHE_TTL env variable
+CATEGORY_CACHE_TTL = 300
 
 ##Helper functions
-def paginate(request , query_result):
+def paginate(request , query):
   '''
-  enables pagination a query result as defined in the global variable QUESTIONS_PER_PAGE
+  paginates a questions query in SQL so only the requested page is loaded and formatted
+  the page is picked with ?page=N (LIMIT/OFFSET) , deep pages can instead pass
+  ?after_id=<id of the last question already seen> which seeks on the primary key
+  rather than making the database walk and discard every skipped row.
   @param request : the request send to the endpoint
-  @param query_result : the result of the query you need to paginate ; this was written of 
-        the questions query but it should work on queries from other models as well
-  @return a list of predefined size list with the correct starting index.
+  @param query : the (not yet executed) questions query you need to paginate
+  @return a list of at most QUESTIONS_PER_PAGE formatted questions ordered by id.
   '''
-  page = request.args.get('page', 1, type=int)
-  start =  (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
-  questions = [question.format() for question in query_result]
-  questions_page = questions[start:end]
-  return questions_page
+  query = query.order_by(Question.id)
+  after_id = request.args.get('after_id', None, type=int)
+  if after_id is not None:
+    query = query.filter(Question.id > after_id)
+  else:
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+      return []
+    query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+  return [question.format() for question in query.limit(QUESTIONS_PER_PAGE).all()]
 
 def convert_categories_dict(cat_query_result):
   '''
@@ -36,36 +52,166 @@ def convert_categories_dict(cat_query_result):
     cat_dict[category.id] = category.type
   return cat_dict
 
+def load_categories():
+  return convert_categories_dict(Category.query.order_by(Category.id).all())
+
+#categories almost never change , so the map is loaded once per process instead of once per request.
+category_cache = CategoryCache(load_categories)
+
+#full text search over the question texts , the backend is picked in create_app.
+question_search = QuestionSearch()
+question_listeners.append(question_search.on_change)
+
+#server side quiz games , opt in with "session" in the /quizzes request (see create_app for the store).
+quiz_sessions = QuizSessions()
+
+#ETag , Last-Modified and Cache-Control of the GET endpoints , the questions version is bumped on every write.
+http_cache = HttpCache(category_cache)
+question_listeners.append(http_cache.on_change)
+
+#question ids per category , a quiz turn draws from it and only loads the drawn question.
+#its listener runs after the one of http_cache , which bumps the version stamp it follows.
+question_index = QuestionIndex()
+question_listeners.append(question_index.on_change)
+
+#per request SQL counters , off unless PERF_SAMPLE_RATE is set (see create_app).
+perf_monitor = PerfMonitor()
+
 def select_questions(like=None):
-    questions=[]
     if like is None:
-      questions = Question.query.all()
+      query = Question.query
+      total_questions = query.count()
+      current_questions = paginate(request , query)
     else:
-      questions = Question.query.filter(Question.question.ilike("%{}%".format(like))).all()
-      if len(questions) == 0 :
-         return jsonify({
+      page = request.args.get('page', 1, type=int)
+      if page < 1:
+        return None
+      total_questions , current_questions = question_search.search(like , page , QUESTIONS_PER_PAGE)
+      if total_questions == 0:
+        return jsonify({
                 'success':True,
                 'questions': [] ,
                 'total_questions' : 0,
-                'categories': convert_categories_dict(Category.query.all())
+                'categories': category_cache.get()
               })
 
-    current_questions = paginate(request , questions)
     if not current_questions:
       return None
 
     return jsonify({
       'success':True,
       'questions': current_questions ,
-      'total_questions' : len(questions) ,
-      'categories': convert_categories_dict(Category.query.all())
+      'total_questions' : total_questions ,
+      'categories': category_cache.get()
     })
 
+def next_session_question(token):
+  '''
+  the next question of a server side quiz session , skipping the questions deleted since it started
+  @param token : the session token returned with the first question
+  @return the /quizzes response , its question is None once the session has asked them all
+  '''
+  next_question = None
+  while next_question is None:
+    try:
+      question_id = quiz_sessions.next(token)
+    except KeyError:
+      #unknown , expired or already finished
+      abort(404)
+    if question_id is None:
+      return jsonify({
+        'success': True,
+        'question': None,
+        'session': token
+      })
+    next_question = Question.query.get(question_id)
+  return jsonify({
+    'success': True,
+    'question': next_question.format(),
+    'session': token
+  })
+
+##command line : flask trivia import / export (FLASK_APP=flaskr)
+trivia_cli = AppGroup('trivia', help='bulk import and export of the questions')
+
+@trivia_cli.command('import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', 'format', type=click.Choice(bulk.FORMATS), default='jsonl', show_default=True)
+@click.option('--batch-size', default=bulk.BATCH_SIZE, show_default=True, help='questions per transaction')
+def import_command(source, format, batch_size):
+  '''
+  imports questions from SOURCE (- for stdin)
+  '''
+  report = bulk.import_questions(bulk.read_questions(bulk.text_stream(source), format),
+                                 category_cache.get(), batch_size=batch_size)
+  for error in report['errors']:
+    click.echo('line {line}: {errors}'.format(**error), err=True)
+  click.echo('{rows} rows read , {imported} imported , {rejected} rejected'.format(**report))
+
+@trivia_cli.command('export')
+@click.argument('destination', type=click.File('w'), default='-')
+@click.option('--format', 'format', type=click.Choice(bulk.FORMATS), default='jsonl', show_default=True)
+def export_command(destination, format):
+  '''
+  writes every question to DESTINATION (stdout by default)
+  '''
+  for text in bulk.export_questions(format):
+    destination.write(text)
+
 ##main app
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)   
+  if test_config and 'SQLALCHEMY_DATABASE_URI' in test_config:
+    setup_db(app , test_config['SQLALCHEMY_DATABASE_URI'])
+  else:
+    setup_db(app)
+  app.config.from_mapping(
+    CATEGORY_CACHE_TTL=float(os.environ.get('CATEGORY_CACHE_TTL', CATEGORY_CACHE_TTL)),
+    #set to a file path to share category invalidations between the workers of a host
+    CATEGORY_CACHE_VERSION_FILE=os.environ.get('CATEGORY_CACHE_VERSION_FILE'),
+    #seconds browsers and CDNs may reuse a GET response without revalidating it , 0 revalidates every time
+    HTTP_CACHE_MAX_AGE=int(os.environ.get('HTTP_CACHE_MAX_AGE', 0)),
+    #set to a file path to share the questions version (and so the ETags) between the workers of a host
+    QUESTIONS_VERSION_FILE=os.environ.get('QUESTIONS_VERSION_FILE'),
+    #seconds between two looks for questions inserted by other workers , the version file triggers one at once
+    QUIZ_INDEX_CHECK_SECONDS=float(os.environ.get('QUIZ_INDEX_CHECK_SECONDS', 1)),
+    #'' keeps the quiz sessions in every worker process , redis://localhost:6379/0 shares them
+    QUIZ_SESSION_URL=os.environ.get('QUIZ_SESSION_URL', ''),
+    #seconds a quiz session lives after its last turn , and how many a worker keeps without redis
+    QUIZ_SESSION_TTL=float(os.environ.get('QUIZ_SESSION_TTL', 3600)),
+    QUIZ_SESSION_MAX=int(os.environ.get('QUIZ_SESSION_MAX', 10000)),
+    #fraction of the requests whose SQL statements are counted and timed , 0 turns the monitor off
+    PERF_SAMPLE_RATE=float(os.environ.get('PERF_SAMPLE_RATE', 0)),
+    PERF_SLOW_QUERY_MS=float(os.environ.get('PERF_SLOW_QUERY_MS', 100)),
+    #serve the aggregated measures on /debug/perf , keep it off on public deployments
+    PERF_ENDPOINT=os.environ.get('PERF_ENDPOINT', '') == '1'
+  )
+  if test_config:
+    app.config.from_mapping(test_config)
+  version_file = app.config['CATEGORY_CACHE_VERSION_FILE']
+  category_cache.configure(ttl=app.config['CATEGORY_CACHE_TTL'],
+                           version=FileVersion(version_file) if version_file else None)
+  questions_version_file = app.config['QUESTIONS_VERSION_FILE']
+  http_cache.configure(max_age=app.config['HTTP_CACHE_MAX_AGE'],
+                       version=FileVersion(questions_version_file) if questions_version_file else None)
+  #the shared stamp also tells the quiz index about the writes of the other workers
+  question_index.configure(version=FileVersion(questions_version_file) if questions_version_file else None,
+                           check_seconds=app.config['QUIZ_INDEX_CHECK_SECONDS'])
+  quiz_sessions.configure(url=app.config['QUIZ_SESSION_URL'], ttl=app.config['QUIZ_SESSION_TTL'],
+                          max_sessions=app.config['QUIZ_SESSION_MAX'])
+  with app.app_context():
+    category_cache.load()
+    question_search.configure(db.engine)
+    question_index.rebuild()
+  perf_monitor.configure(sample_rate=app.config['PERF_SAMPLE_RATE'],
+                         slow_query_ms=app.config['PERF_SLOW_QUERY_MS'])
+  perf_monitor.init_app(app)
+
+  app.cli.add_command(trivia_cli)
+  #the quiz is a POST that only reads , it can run on a replica
+  db.read_only('quiz_next_question')
+
   '''
   @TODO_DONE: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
   '''
@@ -80,16 +226,36 @@ def create_app(test_config=None):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PATCH,POST,DELETE,OPTIONS')
     return response
 
+  if app.config['PERF_ENDPOINT']:
+    @app.route('/debug/perf' , methods=['GET'])
+    def get_perf():
+      '''
+      query counts and database time per route of the sampled requests , the slowest statements ,
+      the category and http cache counters and the state of the connection pools (primary and replicas) of this worker.
+      '''
+      report = perf_monitor.report()
+      report['category_cache'] = category_cache.stats()
+      report['http_cache'] = http_cache.stats()
+      report['pool'] = pool_status(db.engine)
+      report['replica_pools'] = {key: pool_status(db.get_engine(app , key)) for key in db.replica_keys(app)}
+      return jsonify(report)
+
+    @app.route('/debug/perf' , methods=['DELETE'])
+    def reset_perf():
+      perf_monitor.reset()
+      return jsonify({'success': True})
+
   '''
   @TODO_DONE: 
   Create an endpoint to handle GET requests 
   for all available categories.
   '''
   @app.route('/categories' , methods=['GET'])
+  @http_cache.cached
   def get_categories():
     cat_dict={}
     try:
-      cat_dict = convert_categories_dict(Category.query.all())
+      cat_dict = category_cache.get()
     except:
       print(exc_info())
       abort(500)
@@ -114,6 +280,7 @@ def create_app(test_config=None):
   '''
 
   @app.route('/questions' , methods=['GET'])
+  @http_cache.cached
   def get_questions():
     res = select_questions()
     if not res:
@@ -188,6 +355,40 @@ def create_app(test_config=None):
       except:
         abort(422)
       
+  @app.route('/questions/bulk' , methods=['POST'])
+  def import_questions():
+    '''
+    imports the questions of the request body , ?format=jsonl (default) or csv.
+    the questions are validated and inserted in chunks of ?batch_size , each in its own transaction ,
+    the invalid ones are reported with their line number and skipped.
+    '''
+    format = request.args.get('format', 'jsonl')
+    batch_size = request.args.get('batch_size', bulk.BATCH_SIZE, type=int)
+    if format not in bulk.FORMATS or batch_size < 1:
+      abort(400)
+    try:
+      report = bulk.import_questions(bulk.read_questions(bulk.text_stream(request.stream), format),
+                                     category_cache.get(), batch_size=batch_size)
+    except ValueError:
+      #the body could not be parsed , the chunks before the error are committed
+      abort(400)
+    except:
+      print(exc_info())
+      abort(500)
+    report['success'] = True
+    return jsonify(report)
+
+  @app.route('/questions/bulk' , methods=['GET'])
+  def export_questions():
+    '''
+    streams every question , ?format=jsonl (default) or csv
+    '''
+    format = request.args.get('format', 'jsonl')
+    if format not in bulk.FORMATS:
+      abort(400)
+    mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(bulk.export_questions(format)), mimetype=mimetype)
+
   '''
   @TODO_DONE: 
   Create a GET endpoint to get questions based on category. 
@@ -197,27 +398,29 @@ def create_app(test_config=None):
   category to be shown. 
   '''
   @app.route("/categories/<int:cat_id>/questions")
+  @http_cache.cached
   def get_question_by_category(cat_id , methods=["GET"]):
     #verify that the category exists
-    if not Category.query.get(cat_id):
+    if cat_id not in category_cache.get():
       abort(404)
 
-    questions_per_cat = Question.query.filter(Question.category==cat_id).all()
+    questions_per_cat = Question.query.filter(Question.category==cat_id)
+    total_questions = questions_per_cat.count()
     #category is empty.
-    if len(questions_per_cat) == 0 :
+    if total_questions == 0 :
       return jsonify({
       'success':True,
       'questions': [] ,
       'total_questions' : 0 ,
-      'categories': convert_categories_dict(Category.query.all())
+      'categories': category_cache.get()
     })
 
     current_questions = paginate(request , questions_per_cat)
     return jsonify({
       'success':True,
       'questions': current_questions ,
-      'total_questions' : len(questions_per_cat) ,
-      'categories': convert_categories_dict(Category.query.all())
+      'total_questions' : total_questions ,
+      'categories': category_cache.get()
     })
 
 
@@ -237,43 +440,46 @@ def create_app(test_config=None):
   def quiz_next_question():
     try:
       data=request.get_json()
-      prev_questions=data["previous_questions"]
-      cat_id = int(data["quiz_category"]["id"])
+      #"session": true starts a server side session , its token then replaces the other fields
+      session = data.get("session", False)
+      if not isinstance(session, str):
+        prev_questions=[int(q_id) for q_id in data["previous_questions"]]
+        cat_id = int(data["quiz_category"]["id"])
     except:
       abort(400)
+    if isinstance(session, str):
+      return next_session_question(session)
+
+    #category of id 0 means all , verify that any other category is valid.
+    if cat_id != 0 and cat_id not in category_cache.get():
+      abort(422)
+
+    if session:
+      #the remaining questions are shuffled once , every turn then pops the next one.
+      return next_session_question(quiz_sessions.start(question_index.shuffled(cat_id , set(prev_questions))))
+
+    #a uniform draw among the ids of the category that were not asked yet , ids from another
+    #category or repeated ids can not make it miss. only the drawn row is loaded.
+    excluded = set(prev_questions)
+    next_question = None
+    while next_question is None:
+      question_id = question_index.draw(cat_id , excluded)
+      #check if we used all the questions.
+      if question_id is None:
+        return jsonify({
+          'success' : True, 
+          'question' : None
+        })
+      next_question = Question.query.get(question_id)
+      if next_question is None:
+        #deleted by another worker since the index was built.
+        question_index.discard(question_id)
 
-    questions=[]
-    next_question=None
-
-    #category of id 0 means all
-    if cat_id == 0:
-      questions=Question.query.all()
-    else:
-      #verify that the category is valid and get the correct set of questions.
-      if not Category.query.get(cat_id): 
-        abort(422)
-      questions = Question.query.filter(Question.category == cat_id).all()
-
-    #check if we used all the questions.
-    if(len(questions) == len(prev_questions)):
-      return jsonify({
-        'success' : True, 
-        'question' : None
-      })
-
-    while True:
-      next_question = random.choice(questions)
-      if next_question.id not in data["previous_questions"]:
-        break
-      
     return jsonify({
       'success': True ,
       'question' : next_question.format()
     })
 
-    
-
-    
   '''
   @TODO_DONE: 
   Create error handlers for all expected errors 
@@ -0,0 +1,146 @@
+import io
+import csv
+import json
+
+from models import db, Question, notify_question_listeners
+
+#questions validated and inserted per transaction
+BATCH_SIZE = 5000
+#errors kept in the report , the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+#questions read per query by the export
+EXPORT_BATCH_SIZE = 5000
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+
+def read_questions(stream, format):
+  '''
+  yields the questions of a text stream as dicts , one per line in jsonl or one per row of a csv with a header line
+  @raise ValueError when the stream can not be parsed
+  '''
+  if format == 'jsonl':
+    for line in stream:
+      if line.strip():
+        yield json.loads(line)
+  elif format == 'csv':
+    try:
+      for row in csv.DictReader(stream):
+        yield row
+    except csv.Error as error:
+      raise ValueError(str(error))
+  else:
+    raise ValueError('format must be one of {}'.format(', '.join(FORMATS)))
+
+
+def text_stream(binary_stream):
+  return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+def validate_question(raw, categories):
+  '''
+  @param raw : a question as read from the file
+  @param categories : the {id: type} category map , the category must be one of its ids
+  @return (the column values , None) or (None , {field: error})
+  '''
+  if not isinstance(raw, dict):
+    return None, {'question': 'not an object'}
+  errors = {}
+  values = {}
+  for field in ('question', 'answer'):
+    text = raw.get(field)
+    if not isinstance(text, str) or not text.strip():
+      errors[field] = 'required'
+    else:
+      values[field] = text
+  try:
+    category = int(raw.get('category'))
+    if category not in categories:
+      errors['category'] = 'no category with id {}'.format(category)
+    #the column holds the category id as a string
+    values['category'] = str(category)
+  except (TypeError, ValueError):
+    errors['category'] = 'must be a category id'
+  try:
+    values['difficulty'] = int(raw.get('difficulty'))
+    if not 1 <= values['difficulty'] <= 5:
+      errors['difficulty'] = 'must be between 1 and 5'
+  except (TypeError, ValueError):
+    errors['difficulty'] = 'must be an integer'
+  if errors:
+    return None, errors
+  return values, None
+
+
+def import_questions(rows, categories, batch_size=BATCH_SIZE):
+  '''
+  inserts the valid questions , every chunk of batch_size rows is a single executemany committed on its own
+  invalid rows are reported and skipped , they do not abort their chunk. the question listeners get one
+  'reset' once the import is over instead of one notification per question.
+  @param rows : iterable of dicts , e.g. from read_questions
+  @param categories : the {id: type} category map (category_cache.get())
+  @return {'rows', 'imported', 'rejected', 'errors': [{'line', 'errors'}]}
+  '''
+  report = {'rows': 0, 'imported': 0, 'rejected': 0, 'errors': []}
+  table = Question.__table__
+  chunk = []
+
+  def flush():
+    if chunk:
+      db.session.execute(table.insert(), chunk)
+      db.session.commit()
+      report['imported'] += len(chunk)
+      del chunk[:]
+
+  try:
+    for line, raw in enumerate(rows, start=1):
+      report['rows'] = line
+      values, errors = validate_question(raw, categories)
+      if errors:
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+          report['errors'].append({'line': line, 'errors': errors})
+        continue
+      chunk.append(values)
+      if len(chunk) >= batch_size:
+        flush()
+    flush()
+  except:
+    db.session.rollback()
+    raise
+  finally:
+    if report['imported']:
+      notify_question_listeners('reset', [])
+  return report
+
+
+def export_questions(format):
+  '''
+  yields the questions table as lines of text in the given format , ordered by id
+  the table is read in keyset batches so memory does not grow with its size
+  '''
+  if format not in FORMATS:
+    raise ValueError('format must be one of {}'.format(', '.join(FORMATS)))
+  if format == 'csv':
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+  last_id = 0
+  while True:
+    questions = Question.query.filter(Question.id > last_id).order_by(Question.id).limit(EXPORT_BATCH_SIZE).all()
+    if not questions:
+      break
+    last_id = questions[-1].id
+    if format == 'jsonl':
+      yield ''.join(json.dumps(question.format()) + '\n' for question in questions)
+    else:
+      writer.writerows(question.format() for question in questions)
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+    #the loaded questions are not needed anymore
+    db.session.expunge_all()
+  if format == 'csv' and buffer.getvalue():
+    #an empty table still gets its header line
+    yield buffer.getvalue()
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+
+
+class LocalVersion:
+  '''
+  in process version stamp , bumping it only invalidates the caches of this process
+  '''
+  def __init__(self):
+    self.version = 0
+
+  def get(self):
+    return self.version
+
+  def bump(self):
+    self.version += 1
+
+
+class FileVersion:
+  '''
+  version stamp shared by every process on the host (e.g. all gunicorn workers)
+  the stamp is the modification time of a file , reading it is a single stat call
+  and bumping it from any worker invalidates the caches of all of them.
+  @param path : the stamp file , created if it does not exist
+  '''
+  def __init__(self, path):
+    self.path = path
+
+  def get(self):
+    try:
+      return os.stat(self.path).st_mtime_ns
+    except FileNotFoundError:
+      return 0
+
+  def bump(self):
+    with open(self.path, 'a'):
+      pass
+    # mtime resolution can be coarse , make sure the stamp really moves forward.
+    previous = self.get()
+    now = max(time.time_ns(), previous + 1)
+    os.utime(self.path, ns=(now, now))
+
+
+class CategoryCache:
+  '''
+  process wide cache of the {id: type} category map the frontend needs on nearly every response
+  the map is reloaded when the version stamp changed (see invalidate) or when it is older than ttl seconds.
+  @param loader : callable returning a fresh {id: type} dict , called without arguments
+  @param ttl : maximum age of the map in seconds , None to rely on the version stamp only
+  @param version : a LocalVersion (default) or FileVersion to share invalidations between workers
+  '''
+  def __init__(self, loader, ttl=None, version=None):
+    self.loader = loader
+    self.ttl = ttl
+    self.version = version or LocalVersion()
+    self.categories = None
+    self.loaded_version = None
+    self.loaded_at = 0
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  def configure(self, ttl=None, version=None):
+    self.ttl = ttl
+    self.version = version or LocalVersion()
+    self.categories = None
+
+  def is_fresh(self):
+    if self.categories is None or self.loaded_version != self.version.get():
+      return False
+    return self.ttl is None or time.monotonic() - self.loaded_at < self.ttl
+
+  def load(self):
+    '''
+    (re)loads the map from the database and returns it
+    '''
+    with self.lock:
+      version = self.version.get()
+      self.categories = self.loader()
+      self.loaded_version = version
+      self.loaded_at = time.monotonic()
+      return self.categories
+
+  def get(self):
+    '''
+    @returns the cached {id: type} map , it is shared so callers must not modify it
+    '''
+    if self.is_fresh():
+      self.hits += 1
+      return self.categories
+    self.misses += 1
+    return self.load()
+
+  def invalidate(self):
+    '''
+    call after writing to the categories table , every process sharing the version stamp reloads on next use
+    '''
+    self.version.bump()
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'size': len(self.categories or {}),
+      'version': self.loaded_version
+    }
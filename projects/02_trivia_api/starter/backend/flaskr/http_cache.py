@@ -0,0 +1,122 @@
+import math
+import time
+import uuid
+import calendar
+import hashlib
+import functools
+from datetime import datetime
+from flask import request, make_response, current_app
+from models import db
+from .cache import LocalVersion, FileVersion
+
+
+def http_seconds(modified, now=None):
+  '''
+  the Last-Modified (whole seconds) of a change at modified seconds since the epoch
+  it is rounded up once that second is over , so a later write is always later than it ; before then a
+  write may still come in the same second , it is rounded down and the client copy never passes as current.
+  '''
+  rounded_up = math.ceil(modified)
+  return rounded_up if (time.time() if now is None else now) >= rounded_up else math.floor(modified)
+
+
+class HttpCache:
+  '''
+  validators and Cache-Control of the read endpoints , whose responses only change when a question is
+  written or when the category map changes.
+  the questions version is bumped by the question listeners (add , delete , bulk import) and becomes a strong
+  ETag together with a digest of the category map , so a conditional GET carrying the current ETag (or only a
+  If-Modified-Since later than the last change) is answered 304 before the view runs any query.
+  a LocalVersion only sees the writes of its own process , several workers must share a FileVersion or
+  a worker keeps confirming pages another one changed. the ETags of a LocalVersion carry a random id of
+  the process so a restarted worker , whose counter starts over , never confirms an ETag of its previous life.
+  @param categories : the CategoryCache whose map is part of every response
+  @param max_age : seconds browsers and CDNs may reuse a response without asking , 0 makes them revalidate
+  @param version : a LocalVersion (default) or FileVersion shared by the workers
+  '''
+  def __init__(self, categories, max_age=0, version=None):
+    self.categories = categories
+    self.process_id = uuid.uuid4().hex[:8]
+    self.configure(max_age, version)
+
+  def configure(self, max_age=0, version=None):
+    self.max_age = max_age
+    self.version = version or LocalVersion()
+    self.modified_at = time.time()
+    self.categories_seen = None
+    self.category_digest = None
+    self.not_modified = 0
+
+  def on_change(self, action, questions):
+    '''
+    question listener , every write of the questions table changes the ETags
+    '''
+    self.version.bump()
+    self.modified_at = time.time()
+
+  def validators(self):
+    '''
+    @return (etag , last modification time in seconds since the epoch) of the current table state
+    '''
+    version = self.version.get()
+    categories = self.categories.get()
+    if categories is not self.categories_seen:
+      # reloaded , the digest only changes (and the responses with it) if the map did
+      digest = hashlib.sha1(repr(sorted(categories.items())).encode('utf-8')).hexdigest()[:16]
+      if self.category_digest is not None and digest != self.category_digest:
+        self.modified_at = time.time()
+      self.categories_seen , self.category_digest = categories , digest
+    modified = self.modified_at
+    if isinstance(self.version, FileVersion):
+      # the stamp is the time of the last write of any worker
+      etag = '{}-{}'.format(version, self.category_digest)
+      modified = max(modified, version / 1e9)
+    else:
+      etag = '{}-{}-{}'.format(self.process_id, version, self.category_digest)
+    return etag , modified
+
+  def stats(self):
+    return {
+      'not_modified': self.not_modified,
+      'version': self.version.get()
+    }
+
+  def is_modified(self, etag, modified):
+    '''
+    @return False when the client copy is current : its If-None-Match holds the ETag , or without one
+    its If-Modified-Since is strictly later than the last change (see http_seconds)
+    '''
+    if request.if_none_match:
+      return not request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    if since is None:
+      return True
+    return modified >= calendar.timegm(since.utctimetuple())
+
+  def cached(self, view):
+    '''
+    decorator of a GET view , answers 304 when the client has the current version of the response ,
+    otherwise runs the view and adds ETag , Last-Modified and Cache-Control to its successful response
+    '''
+    @functools.wraps(view)
+    def conditional_view(*args, **kwargs):
+      etag , modified = self.validators()
+      last_modified = http_seconds(modified)
+      if not self.is_modified(etag, modified):
+        self.not_modified += 1
+        response = current_app.response_class(status=304)
+      else:
+        if time.time() - modified < current_app.config.get('DB_PRIMARY_PIN_SECONDS', 0):
+          # a replica may not have the last write yet , it must not be served under the new ETag
+          db.use_primary()
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+          return response
+      response.set_etag(etag)
+      response.last_modified = datetime.utcfromtimestamp(last_modified)
+      response.cache_control.public = True
+      response.cache_control.max_age = self.max_age
+      if not self.max_age:
+        response.cache_control.no_cache = True
+      return response
+    return conditional_view
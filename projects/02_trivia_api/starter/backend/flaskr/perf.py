@@ -0,0 +1,126 @@
+import time
+import random
+import threading
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class PerfMonitor:
+  '''
+  opt in per request SQL instrumentation
+  a sampled request records how many statements it sent , the time spent in the database and its
+  slowest statements. the totals are sent back in a Server-Timing header and aggregated per route
+  for report() (served on /debug/perf). requests that are not sampled only pay for a random draw
+  and a flask.g lookup per statement , so it can stay enabled in production at a low sample rate.
+  @param sample_rate : fraction of the requests that are instrumented , 0 turns it off
+  @param slow_query_ms : statements slower than this are kept in the slow query log
+  @param keep : how many statements the slow query log keeps (the slowest ones)
+  '''
+  def __init__(self, sample_rate=0.0, slow_query_ms=100, keep=20):
+    self.configure(sample_rate, slow_query_ms, keep)
+    self.listening = False
+    self.lock = threading.Lock()
+    self.reset()
+
+  def configure(self, sample_rate=0.0, slow_query_ms=100, keep=20):
+    self.sample_rate = sample_rate
+    self.slow_query_ms = slow_query_ms
+    self.keep = keep
+
+  def reset(self):
+    with self.lock:
+      self.routes = {}
+      self.slow_queries = []
+
+  def init_app(self, app):
+    '''
+    hooks the monitor into the requests of app and into every SQLAlchemy engine of the process
+    '''
+    if not self.listening:
+      # listening on the Engine class also covers engines created after this call ,
+      # e.g. when setup_db points the app to another database.
+      event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+      self.listening = True
+    app.before_request(self.start_request)
+    app.after_request(self.finish_request)
+
+  @staticmethod
+  def current():
+    if has_request_context():
+      return g.get('perf')
+    return None
+
+  def start_request(self):
+    if self.sample_rate > 0 and random.random() < self.sample_rate:
+      g.perf = {'started': time.perf_counter(), 'queries': 0, 'db_time': 0.0, 'slowest': []}
+
+  def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    # the start time is kept on the execution context of the statement : a statement that raises never
+    # reaches after_cursor_execute , its context is dropped with it instead of leaving a start time behind.
+    # context is only None for the statements the dialect sends when it connects for the first time.
+    if context is not None and self.current() is not None:
+      context.perf_started = time.perf_counter()
+
+  def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    perf = self.current()
+    started = getattr(context, 'perf_started', None)
+    if perf is None or started is None:
+      return
+    elapsed = time.perf_counter() - started
+    perf['queries'] += 1
+    perf['db_time'] += elapsed
+    perf['slowest'].append((elapsed, statement))
+    perf['slowest'] = sorted(perf['slowest'], reverse=True)[:3]
+
+  def finish_request(self, response):
+    perf = g.pop('perf', None)
+    if perf is None:
+      return response
+    total = time.perf_counter() - perf['started']
+    response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(1000 * perf['db_time'], perf['queries']))
+    for i, (elapsed, statement) in enumerate(perf['slowest']):
+      response.headers.add('Server-Timing', 'sql-{};dur={:.2f}'.format(i + 1, 1000 * elapsed))
+    response.headers.add('Server-Timing', 'app;dur={:.2f}'.format(1000 * total))
+    route = '{} {}'.format(request.method, request.url_rule.rule if request.url_rule else '<unmatched>')
+    self.record(route, perf, total)
+    return response
+
+  def record(self, route, perf, total):
+    with self.lock:
+      stats = self.routes.setdefault(route, {'requests': 0, 'queries': 0, 'max_queries': 0,
+                                             'db_time': 0.0, 'total_time': 0.0, 'max_time': 0.0})
+      stats['requests'] += 1
+      stats['queries'] += perf['queries']
+      stats['max_queries'] = max(stats['max_queries'], perf['queries'])
+      stats['db_time'] += perf['db_time']
+      stats['total_time'] += total
+      stats['max_time'] = max(stats['max_time'], total)
+      for elapsed, statement in perf['slowest']:
+        if 1000 * elapsed >= self.slow_query_ms:
+          # only the statement text is kept , never its parameters.
+          self.slow_queries.append({'route': route, 'ms': round(1000 * elapsed, 2), 'statement': statement[:500]})
+      self.slow_queries = sorted(self.slow_queries, key=lambda query: query['ms'], reverse=True)[:self.keep]
+
+  def report(self):
+    '''
+    @return the aggregated measures of the sampled requests , a json serializable dict
+    '''
+    with self.lock:
+      routes = {}
+      for route, stats in self.routes.items():
+        routes[route] = {
+          'requests': stats['requests'],
+          'queries_per_request': round(stats['queries'] / stats['requests'], 2),
+          'max_queries': stats['max_queries'],
+          'db_ms_per_request': round(1000 * stats['db_time'] / stats['requests'], 2),
+          'ms_per_request': round(1000 * stats['total_time'] / stats['requests'], 2),
+          'max_ms': round(1000 * stats['max_time'], 2)
+        }
+      return {
+        'sample_rate': self.sample_rate,
+        'slow_query_ms': self.slow_query_ms,
+        'routes': routes,
+        'slow_queries': list(self.slow_queries)
+      }
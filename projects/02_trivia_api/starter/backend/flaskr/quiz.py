@@ -0,0 +1,273 @@
+import time
+import bisect
+import random
+import secrets
+import threading
+from array import array
+from collections import OrderedDict
+
+from models import db, Question
+
+#quiz category id of the questions of every category
+ALL = 0
+#closes the id order of every quiz session , question ids start at 1
+END = 0
+#ids below the largest known one that refresh() checks again
+REFRESH_LOOKBACK = 64
+#random draws tried before the draw by rank , a draw only misses on an already asked question
+REJECTION_DRAWS = 8
+
+
+class QuestionIndex:
+  '''
+  the ids of the questions of every category (and of all of them under ALL) kept in the process as
+  sorted arrays , so a quiz turn draws its question without a query and only loads the drawn row.
+  it is built by rebuild() and kept current through the question listeners in models.py.
+  the listeners only see the writes of this process , refresh() adds the questions other workers or
+  processes inserted : it looks for ids above the largest one known when the shared version stamp
+  moved (a FileVersion , see configure) and at most every check_seconds without one. questions deleted
+  elsewhere are dropped when they are drawn (see discard) , category changes made elsewhere are only
+  seen by the next rebuild.
+  '''
+  def __init__(self):
+    self.ids = {ALL: array('l')}
+    self.lock = threading.Lock()
+    self.refresh_lock = threading.Lock()
+    self.configure()
+
+  def configure(self, version=None, check_seconds=1.0):
+    self.version = version
+    self.check_seconds = check_seconds
+    self.seen_version = None
+    self.next_check = 0
+
+  def stamp(self):
+    return self.version.get() if self.version is not None else None
+
+  def rebuild(self):
+    ids = {ALL: array('l')}
+    seen_version = self.stamp()
+    query = db.session.query(Question.id, Question.category).order_by(Question.id)
+    for question_id, category in query.yield_per(10000):
+      ids[ALL].append(question_id)
+      ids.setdefault(int(category), array('l')).append(question_id)
+    with self.lock:
+      self.ids = ids
+      self.seen_version = seen_version
+      self.next_check = time.monotonic() + self.check_seconds
+
+  def refresh(self):
+    '''
+    adds the questions inserted outside of this process since the last check , called before every draw
+    and before a quiz session is shuffled.
+    the query is a range scan of the primary key that only returns the new rows , it looks REFRESH_LOOKBACK
+    ids back because the ids of concurrent transactions are not committed in order.
+    '''
+    stamp = self.stamp()
+    if stamp == self.seen_version and time.monotonic() < self.next_check:
+      return
+    # one request catches up , the others keep drawing from the index as it is
+    if not self.refresh_lock.acquire(blocking=False):
+      return
+    try:
+      self.seen_version = stamp
+      self.next_check = time.monotonic() + self.check_seconds
+      last_id = self.ids[ALL][-1] if self.ids[ALL] else 0
+      rows = (db.session.query(Question.id, Question.category)
+              .filter(Question.id > last_id - REFRESH_LOOKBACK).order_by(Question.id).all())
+      with self.lock:
+        for question_id, category in rows:
+          self.add(question_id, int(category))
+    finally:
+      self.refresh_lock.release()
+
+  def on_change(self, action, questions):
+    if action == 'reset':
+      self.rebuild()
+      return
+    with self.lock:
+      for question in questions:
+        self.remove(question['id'])
+        if action != 'delete':
+          self.add(question['id'], int(question['category']))
+      # the stamp was bumped for this write (the http cache listener runs first) , which the index already has
+      self.seen_version = self.stamp()
+
+  def add(self, question_id, category):
+    for key in (ALL, category):
+      ids = self.ids.setdefault(key, array('l'))
+      # new questions have the largest id , the append keeps the array sorted
+      if not ids or ids[-1] < question_id:
+        ids.append(question_id)
+        continue
+      position = bisect.bisect_left(ids, question_id)
+      if ids[position] != question_id:
+        ids.insert(position, question_id)
+
+  def remove(self, question_id):
+    for ids in self.ids.values():
+      position = bisect.bisect_left(ids, question_id)
+      if position < len(ids) and ids[position] == question_id:
+        del ids[position]
+
+  def discard(self, question_id):
+    '''
+    drops the id of a question that no longer exists (deleted by another worker)
+    '''
+    with self.lock:
+      self.remove(question_id)
+
+  def shuffled(self, category, excluded=()):
+    '''
+    @return the ids of the questions of category not in excluded , in random order
+    '''
+    self.refresh()
+    with self.lock:
+      ids = [question_id for question_id in self.ids.get(category, ()) if question_id not in excluded]
+    random.shuffle(ids)
+    return ids
+
+  def count(self, category=ALL):
+    return len(self.ids.get(category, ()))
+
+  def draw(self, category, excluded=()):
+    '''
+    @param category : a category id or ALL
+    @param excluded : set of the question ids already asked
+    @return the id of a question of category not in excluded drawn uniformly , None when none is left
+    '''
+    self.refresh()
+    with self.lock:
+      ids = self.ids.get(category)
+      if not ids:
+        return None
+      for _ in range(REJECTION_DRAWS):
+        question_id = random.choice(ids)
+        if question_id not in excluded:
+          return question_id
+      # most of the category was asked : draw a rank among the ids left and skip over the positions of
+      # the asked ones , found by bisection. the work follows the size of excluded , not of the category.
+      positions = set()
+      for question_id in excluded:
+        position = bisect.bisect_left(ids, question_id)
+        if position < len(ids) and ids[position] == question_id:
+          positions.add(position)
+      if len(positions) == len(ids):
+        return None
+      index = random.randrange(len(ids) - len(positions))
+      for position in sorted(positions):
+        if position > index:
+          break
+        index += 1
+      return ids[index]
+
+
+class MemorySessionStore:
+  '''
+  quiz sessions kept in the process , the least recently played are dropped beyond max_sessions.
+  the turns of a session must reach the worker that started it , use a RedisSessionStore otherwise.
+  '''
+  def __init__(self, ttl=3600, max_sessions=10000):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self.sessions = OrderedDict()   # token -> (expires at , ids in reverse order)
+    self.lock = threading.Lock()
+
+  def create(self, token, ids):
+    order = array('l', [END])
+    order.extend(reversed(ids))
+    now = time.monotonic()
+    with self.lock:
+      # the oldest sessions come first , drop the expired ones and make room
+      while self.sessions:
+        oldest = next(iter(self.sessions))
+        if self.sessions[oldest][0] > now and len(self.sessions) < self.max_sessions:
+          break
+        del self.sessions[oldest]
+      self.sessions[token] = (now + self.ttl, order)
+
+  def pop(self, token):
+    now = time.monotonic()
+    with self.lock:
+      entry = self.sessions.get(token)
+      if entry is None or entry[0] < now:
+        self.sessions.pop(token, None)
+        raise KeyError(token)
+      question_id = entry[1].pop()
+      if question_id == END:
+        del self.sessions[token]
+      else:
+        self.sessions[token] = (now + self.ttl, entry[1])
+        self.sessions.move_to_end(token)
+      return question_id
+
+  def __len__(self):
+    return len(self.sessions)
+
+
+class RedisSessionStore:
+  '''
+  quiz sessions kept as redis lists (or in any local server speaking its protocol) seen by every worker.
+  needs the redis package.
+  @param url : e.g. redis://localhost:6379/0
+  @param prefix : prepended to every session token
+  '''
+  def __init__(self, url, ttl=3600, prefix='trivia:quiz:'):
+    try:
+      import redis
+    except ImportError:
+      raise RuntimeError('a redis:// quiz session store needs the redis package , pip install redis')
+    self.client = redis.Redis.from_url(url)
+    self.ttl = max(1, int(ttl))
+    self.prefix = prefix
+
+  def create(self, token, ids):
+    pipe = self.client.pipeline()
+    pipe.rpush(self.prefix + token, *(list(ids) + [END]))
+    pipe.expire(self.prefix + token, self.ttl)
+    pipe.execute()
+
+  def pop(self, token):
+    pipe = self.client.pipeline()
+    pipe.lpop(self.prefix + token)
+    pipe.expire(self.prefix + token, self.ttl)
+    question_id , _ = pipe.execute()
+    if question_id is None:
+      raise KeyError(token)
+    # redis drops the list with its last element , END included
+    return int(question_id)
+
+  def __len__(self):
+    return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*'))
+
+
+class QuizSessions:
+  '''
+  server side quiz games : the ids of a game are shuffled once when it starts and every turn pops the next
+  one , so the client only sends its session token instead of every question already asked.
+  @param url : redis://... to share the sessions between the workers , empty to keep them in the process
+  @param ttl : seconds a session lives after its last turn
+  @param max_sessions : sessions kept in the process (in process store only)
+  '''
+  def __init__(self, url='', ttl=3600, max_sessions=10000):
+    self.configure(url, ttl, max_sessions)
+
+  def configure(self, url='', ttl=3600, max_sessions=10000):
+    self.store = RedisSessionStore(url, ttl) if url else MemorySessionStore(ttl, max_sessions)
+
+  def start(self, ids):
+    '''
+    @param ids : the question ids of the game in the order they are asked
+    @return the token of the new session
+    '''
+    token = secrets.token_urlsafe(16)
+    self.store.create(token, ids)
+    return token
+
+  def next(self, token):
+    '''
+    @return the next question id of the session , None once they were all asked (the session then ends)
+    @raise KeyError : unknown , expired or ended session
+    '''
+    question_id = self.store.pop(token)
+    return None if question_id == END else question_id
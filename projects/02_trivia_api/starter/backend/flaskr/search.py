@@ -0,0 +1,198 @@
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import func
+from models import db, Question
+
+WORD = re.compile(r'[^\W_]+')
+#shortest word of a term that is searched , a trigram index can not find a part of a word shorter than a trigram
+MIN_WORD = 3
+#matches ranked by relevance , beyond that they are listed by id : ranking scores every match before the page is cut
+MAX_RANKED = 1000
+
+
+def tokenize(text):
+  '''
+  lower cased words of a text , the same rule is applied to questions and search terms
+  '''
+  return WORD.findall((text or '').lower())
+
+
+def term_words(term):
+  '''
+  @return the words of a search term that are searched (the ones of MIN_WORD characters or more) ,
+  None for a blank term which lists every question. a term without such a word (e.g. only
+  punctuation or "of a") finds nothing.
+  '''
+  if not (term or '').strip():
+    return None
+  return [word for word in tokenize(term) if len(word) >= MIN_WORD]
+
+
+def trigrams(word):
+  return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class PostgresQuestionSearch:
+  '''
+  substring search on postgres , served by the trigram GIN index created in
+  migrations/002_questions_search_trigram.sql (pg_trgm also speeds up ILIKE with a leading wildcard)
+  every word of the term must occur in the question , in any order and anywhere in a word ("ssor" finds
+  "professor") , stop words are not dropped , words shorter than MIN_WORD are (see term_words).
+  up to MAX_RANKED matches are ranked by trigram similarity to the term , more are listed by id ;
+  counting and pagination run in the database.
+  '''
+  def search(self, term, page, per_page):
+    '''
+    @return (total number of matches , formatted questions of the requested page)
+    '''
+    words = term_words(term)
+    if words is None:
+      query = Question.query.order_by(Question.id)
+      return query.count(), [q.format() for q in query.offset((page - 1) * per_page).limit(per_page)]
+    if not words:
+      return 0, []
+
+    # the words hold no LIKE wildcard , tokenize() only keeps letters and digits
+    matches = db.and_(*[Question.question.ilike('%{}%'.format(word)) for word in words])
+    total = db.session.query(func.count(Question.id)).filter(matches).scalar()
+    if total == 0:
+      return 0, []
+    page_query = Question.query.filter(matches)
+    if total <= MAX_RANKED:
+      page_query = page_query.order_by(func.similarity(Question.question, ' '.join(words)).desc(), Question.id)
+    else:
+      page_query = page_query.order_by(Question.id)
+    page_query = page_query\
+      .offset((page - 1) * per_page)\
+      .limit(per_page)
+    return total, [question.format() for question in page_query]
+
+  def on_change(self, action, questions):
+    # the database maintains the index.
+    pass
+
+  def rebuild(self):
+    pass
+
+
+class InMemoryQuestionSearch:
+  '''
+  inverted index of the question texts kept in the process , used when the database has no
+  trigram index (sqlite test runs). it finds the same questions as PostgresQuestionSearch : every word
+  of the term must occur in a word of the question , up to MAX_RANKED matches are ranked by how many
+  times the words containing the term words occur in them.
+  the words containing a term word are found through the trigrams they share with it , like pg_trgm does.
+  the index is built by rebuild() and kept current through the question listeners in models.py
+  '''
+  def __init__(self):
+    self.postings = {}    # word -> {question id: occurrences}
+    self.documents = {}   # question id -> Counter of its words
+    self.trigrams = {}    # trigram -> set of the words holding it
+    self.lock = threading.Lock()
+
+  def rebuild(self):
+    with self.lock:
+      self.postings = {}
+      self.documents = {}
+      self.trigrams = {}
+      for question_id, text in db.session.query(Question.id, Question.question).yield_per(10000):
+        self.add(question_id, text)
+
+  def add(self, question_id, text):
+    words = Counter(tokenize(text))
+    self.documents[question_id] = words
+    for word, occurrences in words.items():
+      postings = self.postings.get(word)
+      if postings is None:
+        postings = self.postings[word] = {}
+        for trigram in trigrams(word):
+          self.trigrams.setdefault(trigram, set()).add(word)
+      postings[question_id] = occurrences
+
+  def remove(self, question_id):
+    for word in self.documents.pop(question_id, ()):
+      postings = self.postings[word]
+      del postings[question_id]
+      if not postings:
+        del self.postings[word]
+        for trigram in trigrams(word):
+          words = self.trigrams[trigram]
+          words.discard(word)
+          if not words:
+            del self.trigrams[trigram]
+
+  def on_change(self, action, questions):
+    if action == 'reset':
+      self.rebuild()
+      return
+    with self.lock:
+      for question in questions:
+        self.remove(question['id'])
+        if action != 'delete':
+          self.add(question['id'], question['question'])
+
+  def words_containing(self, fragment):
+    '''
+    @param fragment : a word of MIN_WORD characters or more
+    '''
+    # the words holding every trigram of the fragment , starting from the rarest trigram
+    candidates = sorted((self.trigrams.get(trigram, ()) for trigram in trigrams(fragment)), key=len)
+    if not candidates or not candidates[0]:
+      return []
+    return [word for word in candidates[0].intersection(*candidates[1:]) if fragment in word]
+
+  def search(self, term, page, per_page):
+    '''
+    @return (total number of matches , formatted questions of the requested page)
+    '''
+    words = term_words(term)
+    with self.lock:
+      if words is None:
+        ranked = sorted(self.documents)
+      elif not words:
+        return 0, []
+      else:
+        scores = None
+        for fragment in words:
+          fragment_scores = Counter()
+          for word in self.words_containing(fragment):
+            fragment_scores.update(self.postings[word])
+          if scores is None:
+            scores = fragment_scores
+          else:
+            scores = Counter({q_id: score + fragment_scores[q_id] for q_id, score in scores.items() if q_id in fragment_scores})
+          if not scores:
+            return 0, []
+        if len(scores) <= MAX_RANKED:
+          ranked = sorted(scores, key=lambda q_id: (-scores[q_id], q_id))
+        else:
+          ranked = sorted(scores)
+
+    page_ids = ranked[(page - 1) * per_page:page * per_page]
+    if not page_ids:
+      return len(ranked), []
+    rows = {question.id: question for question in Question.query.filter(Question.id.in_(page_ids))}
+    return len(ranked), [rows[q_id].format() for q_id in page_ids if q_id in rows]
+
+
+class QuestionSearch:
+  '''
+  the question search used by the app , configure() picks the backend matching the database
+  '''
+  def __init__(self):
+    self.backend = InMemoryQuestionSearch()
+
+  def configure(self, engine):
+    if engine.dialect.name == 'postgresql':
+      self.backend = PostgresQuestionSearch()
+    else:
+      self.backend = InMemoryQuestionSearch()
+    self.backend.rebuild()
+
+  def search(self, term, page, per_page):
+    return self.backend.search(term, page, per_page)
+
+  def on_change(self, action, questions):
+    self.backend.on_change(action, questions)
@@ -0,0 +1,2 @@
+-- reverts 001_questions_search_index.sql
+DROP INDEX CONCURRENTLY IF EXISTS questions_question_search_idx;
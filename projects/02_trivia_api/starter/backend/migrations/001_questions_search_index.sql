@@ -0,0 +1,7 @@
+-- full text search index for POST /questions {"searchTerm": ...}
+-- superseded by 002_questions_search_trigram.sql , which drops this index again : a new database only needs 002
+-- apply with : psql trivia < migrations/001_questions_search_index.sql
+-- CONCURRENTLY keeps the table writable while the index builds , so it can not run inside a transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS questions_question_search_idx
+    ON questions USING GIN (to_tsvector('english', coalesce(question, '')));
@@ -0,0 +1,2 @@
+-- reverts 002_questions_search_trigram.sql , the full text index of 001 has to be created again
+DROP INDEX CONCURRENTLY IF EXISTS questions_question_trgm_idx;
@@ -0,0 +1,12 @@
+-- trigram index for POST /questions {"searchTerm": ...} , replaces the full text index of 001
+-- the english text search configuration dropped stop words ("what" , "the") and stemmed the words , and it
+-- could not find a part of a word , PostgresQuestionSearch in flaskr/search.py now runs ILIKE '%word%' on it
+-- apply with : psql trivia < migrations/002_questions_search_trigram.sql
+-- CONCURRENTLY keeps the table writable while the index builds , so it can not run inside a transaction.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS questions_question_trgm_idx
+    ON questions USING GIN (question gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS questions_question_search_idx;
@@ -1,12 +1,15 @@
 import os
 from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
 import json
 
+from pool import engine_options
+from routing import RoutingSQLAlchemy, replica_binds
+
 database_name = "trivia"
 database_path = "postgresql:///{}".format(database_name)
 
-db = SQLAlchemy()
+# reads of the GET requests go to the replicas of DATABASE_REPLICA_URLS when there are some (see routing.py)
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
@@ -15,10 +18,30 @@ setup_db(app)
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # pool size , overflow , timeouts ... from the DB_* environment variables (see pool.py)
+    options = engine_options(database_path)
+    if database_path.startswith("postgresql"):
+        # psycopg2 sends an executemany (bulk imports) as multi row INSERTs instead of one statement per row
+        options["executemany_mode"] = "values"
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", options)
+    app.config.setdefault("SQLALCHEMY_BINDS", replica_binds())
     db.app = app
     db.init_app(app)
     db.create_all()
 
+'''
+question_listeners
+    callables notified after questions were committed , called as listener(action, questions)
+    action is 'insert', 'update' or 'delete' and questions a list of formatted questions (see Question.format)
+    or 'reset' with an empty list after a bulk write (see flaskr/bulk.py) , listeners then reload from the table
+    used to keep in memory structures (e.g. the search index) in sync with the table
+'''
+question_listeners = []
+
+def notify_question_listeners(action, questions):
+    for listener in question_listeners:
+        listener(action, questions)
+
 '''
 Question
 '''
@@ -40,13 +63,17 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    notify_question_listeners('insert', [self.format()])
   
   def update(self):
     db.session.commit()
+    notify_question_listeners('update', [self.format()])
 
   def delete(self):
+    deleted = self.format()
     db.session.delete(self)
     db.session.commit()
+    notify_question_listeners('delete', [deleted])
 
   def format(self):
     return {
@@ -0,0 +1,100 @@
+'''
+connection pool of the database engine
+the engine options are read from the environment so the pool can be sized to the number of workers
+without a code change :
+    DB_POOL_SIZE             connections kept open per process (5)
+    DB_MAX_OVERFLOW          extra connections opened under load (10)
+    DB_POOL_TIMEOUT          seconds a request waits for a free connection (30)
+    DB_POOL_RECYCLE          seconds before a connection is reopened , -1 never (1800)
+    DB_POOL_PRE_PING         1 to test a connection before handing it out (1)
+    DB_STATEMENT_TIMEOUT_MS  postgres statement_timeout , 0 for none (0)
+every process opens up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections , the sum over all the workers
+must stay below the max_connections of the server.
+every project is deployed on its own , so each one carries a copy of this module (fyyur , trivia , coffee shop
+and the heroku sample). test_flaskr.py checks that the copies keep the same code.
+'''
+import os
+import time
+import threading
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+  '''
+  QueuePool that measures how long the checkouts wait for a connection and counts the ones that timed out
+  a growing wait means the pool is too small for the concurrency of its process , it shows up here
+  before the requests time out.
+  '''
+  def __init__(self, creator, pool_size=5, max_overflow=10, **kw):
+    super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+    # -1 is an unbounded overflow
+    self.capacity = None if max_overflow < 0 else pool_size + max_overflow
+    self.lock = threading.Lock()
+    self.checkouts = 0
+    self.timeouts = 0
+    self.wait_time = 0.0
+    self.max_wait = 0.0
+
+  def _do_get(self):
+    started = time.perf_counter()
+    timed_out = False
+    try:
+      return super()._do_get()
+    except TimeoutError:
+      timed_out = True
+      raise
+    finally:
+      waited = time.perf_counter() - started
+      with self.lock:
+        self.checkouts += 1
+        self.timeouts += timed_out
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+
+
+def engine_options(database_uri, env=os.environ):
+  '''
+  @return the SQLALCHEMY_ENGINE_OPTIONS of database_uri , sqlite keeps its default pool and only gets the pre ping
+  '''
+  options = {'pool_pre_ping': env.get('DB_POOL_PRE_PING', '1') == '1'}
+  if database_uri.startswith('sqlite'):
+    return options
+  options.update({
+    'poolclass': TimedQueuePool,
+    'pool_size': int(env.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(env.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(env.get('DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(env.get('DB_POOL_RECYCLE', 1800))
+  })
+  statement_timeout = int(env.get('DB_STATEMENT_TIMEOUT_MS', 0))
+  if statement_timeout and database_uri.startswith('postgres'):
+    options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+  return options
+
+
+def pool_status(engine):
+  '''
+  @return the state of the pool of engine , a json serializable dict
+  '''
+  pool = engine.pool
+  status = {'pool': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    status.update({
+      'size': pool.size(),
+      'checked_out': pool.checkedout(),
+      'idle': pool.checkedin(),
+      # overflow() counts up from -size , it is only positive once the pool is full
+      'overflow': max(0, pool.overflow())
+    })
+  if isinstance(pool, TimedQueuePool):
+    with pool.lock:
+      status.update({
+        'capacity': pool.capacity,
+        'saturation': round(pool.checkedout() / pool.capacity, 2) if pool.capacity else None,
+        'checkouts': pool.checkouts,
+        'timeouts': pool.timeouts,
+        'wait_ms_per_checkout': round(1000 * pool.wait_time / pool.checkouts, 3) if pool.checkouts else 0.0,
+        'max_wait_ms': round(1000 * pool.max_wait, 3)
+      })
+  return status
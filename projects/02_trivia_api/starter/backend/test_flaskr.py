@@ -1,10 +1,36 @@
 import os
+import ast
+import time
 import unittest
 import json
+from flask import g
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, category_cache, question_index, http_cache
+from flaskr.http_cache import http_seconds
+from models import setup_db, db, Question, Category
+import pool
+import routing
+from pool import engine_options
+from routing import PIN_COOKIE, replica_binds
+
+#the other projects carry copies of some modules of the backend , see test_pool_copies and test_routing_copies
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+
+
+def module_code(path):
+    """
+    the code of a python file without its docstrings , comments and layout
+    """
+    with open(path) as source:
+        tree = ast.parse(source.read())
+    for node in ast.walk(tree):
+        if isinstance(getattr(node, "body", None), list):
+            node.body = [statement for statement in node.body
+                         if not (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant)
+                                 and isinstance(statement.value.value, str))]
+    return ast.dump(tree)
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -52,6 +78,25 @@ class TriviaTestCase(unittest.TestCase):
         data=json.loads(res.data)
         self.assertEqual(res.status_code , 404)
 
+
+    def test_questions_keyset_page(self):
+        """
+        ?after_id=<last id of page 1> should return the same questions as ?page=2
+        """
+        first_page = json.loads(self.client().get("/questions").data)
+        second_page = json.loads(self.client().get("/questions" , query_string={"page": 2}).data)
+        res = self.client().get("/questions" , query_string={"after_id": first_page["questions"][-1]["id"]})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code , 200)
+        self.assertEqual(data["questions"] , second_page["questions"])
+        self.assertEqual(data["total_questions"] , first_page["total_questions"])
+
+    def test_questions_keyset_page_error(self):
+        """
+        a cursor past the last question is an empty page and returns 404
+        """
+        res = self.client().get("/questions" , query_string={"after_id": 100000000})
+        self.assertEqual(res.status_code , 404)
     
     def test_get_categories(self):
         """
@@ -64,6 +109,176 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data["categories"]) , 6 )
         self.assertEqual(data["total_categories"] , 6 )
 
+    def test_category_cache(self):
+        """
+        the category map is served from the cache until it is invalidated
+        """
+        misses = category_cache.stats()["misses"]
+        self.client().get("/categories")
+        self.client().get("/questions")
+        self.assertEqual(category_cache.stats()["misses"] , misses)
+        category_cache.invalidate()
+        res = self.client().get("/categories")
+        data = json.loads(res.data)
+        self.assertEqual(category_cache.stats()["misses"] , misses + 1)
+        self.assertEqual(len(data["categories"]) , 6)
+
+    def test_perf_monitor(self):
+        """
+        sampled requests report their queries in Server-Timing and are aggregated on /debug/perf
+        """
+        app = create_app({"PERF_SAMPLE_RATE": 1, "PERF_ENDPOINT": True})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        client.delete("/debug/perf")
+        res = client.get("/questions")
+        self.assertIn('db;dur=', res.headers["Server-Timing"])
+        data = json.loads(client.get("/debug/perf").data)
+        self.assertEqual(data["routes"]["GET /questions"]["requests"] , 1)
+        self.assertGreater(data["routes"]["GET /questions"]["queries_per_request"] , 0)
+        self.assertIn("category_cache" , data)
+        self.assertIn("pool" , data)
+
+    def test_perf_monitor_failed_statement(self):
+        """
+        a statement that raises is not measured and leaves nothing behind for the next ones
+        """
+        app = create_app({"PERF_SAMPLE_RATE": 1})
+        setup_db(app, self.database_path)
+        with app.test_request_context("/questions"):
+            app.preprocess_request()
+            with self.assertRaises(Exception):
+                db.session.execute("SELECT * FROM no_such_table")
+            db.session.rollback()
+            started = time.perf_counter()
+            db.session.execute("SELECT 1")
+            elapsed = time.perf_counter() - started
+            perf = g.perf
+            self.assertNotIn("perf_started" , db.session.connection().info)
+        self.assertEqual(perf["queries"] , 1)
+        self.assertLessEqual(perf["db_time"] , elapsed)
+
+    def test_pool_engine_options(self):
+        """
+        the pool is sized from the environment , sqlite keeps its own pool
+        """
+        options = engine_options("postgresql:///trivia" , {"DB_POOL_SIZE":"20","DB_MAX_OVERFLOW":"0","DB_STATEMENT_TIMEOUT_MS":"5000"})
+        self.assertEqual(options["pool_size"] , 20)
+        self.assertEqual(options["max_overflow"] , 0)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertEqual(options["connect_args"] , {"options":"-c statement_timeout=5000"})
+        self.assertNotIn("pool_size" , engine_options("sqlite://" , {"DB_POOL_SIZE":"20"}))
+
+    def assert_copies_in_sync(self, module, copies):
+        for copy in copies:
+            path = os.path.join(PROJECTS_DIR, *copy)
+            # a project checked out on its own has no copies to compare
+            if os.path.exists(path):
+                self.assertEqual(module_code(path), module_code(module.__file__), path)
+
+    def test_pool_copies(self):
+        """
+        every project is deployed on its own and carries a copy of pool.py , they must keep the same code
+        """
+        self.assert_copies_in_sync(pool, [
+            ("01_fyyur", "starter_code", "pool.py"),
+            ("03_coffee_shop_full_stack", "starter_code", "backend", "src", "database", "pool.py"),
+            ("capstone", "heroku_sample", "starter", "pool.py")])
+
+    def test_routing_copies(self):
+        """
+        fyyur and the coffee shop carry a copy of routing.py , they must keep the same code
+        """
+        self.assert_copies_in_sync(routing, [
+            ("01_fyyur", "starter_code", "routing.py"),
+            ("03_coffee_shop_full_stack", "starter_code", "backend", "src", "database", "routing.py")])
+
+    def test_read_replica_routing(self):
+        """
+        the read only requests run on the replica , the writes and the pinned clients on the primary
+        """
+        self.assertEqual(replica_binds({"DATABASE_REPLICA_URLS":"postgresql://a/trivia, postgresql://b/trivia"}) ,
+            {"replica_0":"postgresql://a/trivia" , "replica_1":"postgresql://b/trivia"})
+        # a second engine on the same database stands for the replica
+        self.app.config["SQLALCHEMY_BINDS"] = {"replica_0": self.app.config["SQLALCHEMY_DATABASE_URI"]}
+        replica = db.get_engine(self.app , "replica_0")
+        primary = db.get_engine(self.app)
+        for method , path , engine in (("GET" , "/questions" , replica) , ("POST" , "/quizzes" , replica) ,
+                                       ("POST" , "/questions" , primary)):
+            with self.app.test_request_context(path , method=method):
+                self.assertIs(db.session.get_bind(Question.__mapper__) , engine)
+        with self.app.test_request_context("/questions" , method="POST"):
+            response = db.pin_writes(self.app.make_response(("" , 200)))
+        cookie = response.headers["Set-Cookie"]
+        self.assertTrue(cookie.startswith(PIN_COOKIE))
+        with self.app.test_request_context("/questions" , headers={"Cookie": cookie.split(";")[0]}):
+            self.assertIs(db.session.get_bind(Question.__mapper__) , primary)
+
+    def test_conditional_get(self):
+        """
+        a GET sending back the current ETag gets a 304 without any query , a write changes the ETag
+        """
+        res = self.client().get("/questions?page=2")
+        self.assertEqual(res.status_code , 200)
+        self.assertIn("public" , res.headers["Cache-Control"])
+        self.assertIsNotNone(res.headers.get("Last-Modified"))
+        etag = res.headers["ETag"]
+        statements = []
+        def count(*args):
+            statements.append(args)
+        engine = db.get_engine(self.app)
+        event.listen(engine , "before_cursor_execute" , count)
+        try:
+            res = self.client().get("/questions?page=2" , headers={"If-None-Match": etag})
+        finally:
+            event.remove(engine , "before_cursor_execute" , count)
+        self.assertEqual(res.status_code , 304)
+        self.assertEqual(res.data , b"")
+        self.assertEqual(statements , [])
+
+        test_q = Question(question="etag?" , answer="test" , category=1 , difficulty=1)
+        test_q.insert()
+        test_q.delete()
+        res = self.client().get("/questions?page=2" , headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code , 200)
+        self.assertNotEqual(res.headers["ETag"] , etag)
+
+    def test_if_modified_since(self):
+        """
+        without an ETag the date only confirms a copy made after the second of the last write was over
+        """
+        self.assertEqual(http_seconds(10.2 , now=10.5) , 10)
+        self.assertEqual(http_seconds(10.2 , now=11) , 11)
+        http_cache.modified_at -= 10
+        res = self.client().get("/questions")
+        last_modified = res.headers["Last-Modified"]
+        res = self.client().get("/questions" , headers={"If-Modified-Since": last_modified})
+        self.assertEqual(res.status_code , 304)
+        # a write in the same second as the copy
+        res = self.client().get("/questions")
+        test_q = Question(question="ims?" , answer="test" , category=1 , difficulty=1)
+        test_q.insert()
+        res = self.client().get("/questions" , headers={"If-Modified-Since": res.headers["Last-Modified"]})
+        test_q.delete()
+        self.assertEqual(res.status_code , 200)
+
+    def test_conditional_get_error(self):
+        """
+        errors carry no validators , they are not cached
+        """
+        res = self.client().get("/categories/100000/questions")
+        self.assertEqual(res.status_code , 404)
+        self.assertNotIn("ETag" , res.headers)
+
+    def test_perf_monitor_off(self):
+        """
+        without a sample rate nothing is measured and /debug/perf does not exist
+        """
+        res = self.client().get("/questions")
+        self.assertNotIn("Server-Timing" , res.headers)
+        res = self.client().get("/debug/perf")
+        self.assertEqual(res.status_code , 404)
+
     def test_delete_question(self):
         """
         adds a dummy question then attempts to delete it ; verify expected behavior.
@@ -104,6 +319,36 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["total_questions"],1)
         self.assertEqual(len(data["questions"]) , 1)
     
+    def test_search_question_partial_word(self):
+        """
+        every word of the term matches a part of a word , in any order
+        """
+        res= self.client().post("/questions" , json={"searchTerm":"anne ACT"})
+        data=json.loads(res.data)
+        self.assertEqual(res.status_code,200)
+        self.assertEqual(data["total_questions"],1)
+        self.assertEqual(data["questions"][0]["answer"] , "Tom Cruise")
+
+    def test_search_question_substring(self):
+        """
+        the middle of a word and stop words match , as any substring of the question does
+        """
+        res= self.client().post("/questions" , json={"searchTerm":"nounce, THEN pr"})
+        data=json.loads(res.data)
+        self.assertEqual(res.status_code,200)
+        self.assertEqual(data["total_questions"],1)
+        self.assertEqual(data["questions"][0]["answer"] , "Tom Cruise")
+
+    def test_search_question_short_words(self):
+        """
+        words shorter than a trigram are not searched , a term made only of them or of punctuation finds nothing
+        """
+        for term in ("?!", "of a", "anne of ACT"):
+            res= self.client().post("/questions" , json={"searchTerm":term})
+            data=json.loads(res.data)
+            self.assertEqual(res.status_code,200)
+            self.assertEqual(data["total_questions"] , 1 if term == "anne of ACT" else 0)
+
     def test_search_question_noresults(self):
         res= self.client().post("/questions" , json={"searchTerm":"THISDOESNOTEXIST"})
         data=json.loads(res.data)
@@ -116,6 +361,42 @@ class TriviaTestCase(unittest.TestCase):
         data=json.loads(res.data)
         self.assertEqual(res.status_code,422)
     
+    def test_bulk_import(self):
+        """
+        valid questions are imported and searchable , the invalid ones are reported with their line
+        """
+        body = "\n".join(json.dumps(question) for question in [
+            {"question":"Which bulkimported planet is red?","answer":"Mars","category":1,"difficulty":2},
+            {"question":"no such category","answer":"x","category":10000,"difficulty":1},
+            {"question":"Which bulkimported metal is liquid?","answer":"Mercury","category":"1","difficulty":3},
+        ])
+        res = self.client().post("/questions/bulk?batch_size=1" , data=body)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code , 200)
+        self.assertEqual(data["imported"] , 2)
+        self.assertEqual(data["rejected"] , 1)
+        self.assertEqual(data["errors"][0]["line"] , 2)
+        self.assertIn("category" , data["errors"][0]["errors"])
+        res = self.client().post("/questions" , json={"searchTerm":"bulkimported"})
+        data = json.loads(res.data)
+        self.assertEqual(data["total_questions"] , 2)
+        for question in data["questions"]:
+            self.client().delete("/questions/{}".format(question["id"]))
+
+    def test_bulk_import_error(self):
+        res = self.client().post("/questions/bulk?format=xml" , data="<question/>")
+        self.assertEqual(res.status_code , 400)
+        res = self.client().post("/questions/bulk" , data="{not json")
+        self.assertEqual(res.status_code , 400)
+
+    def test_bulk_export(self):
+        res = self.client().get("/questions/bulk?format=csv")
+        self.assertEqual(res.status_code , 200)
+        lines = res.data.decode().splitlines()
+        self.assertEqual(lines[0] , "id,question,answer,category,difficulty")
+        with self.app.app_context():
+            self.assertEqual(len(lines) - 1 , Question.query.count())
+
     def test_question_by_category(self):
         res=self.client().get("/categories/5/questions")
         data=json.loads(res.data)
@@ -149,6 +430,106 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data["question"]),5)
         self.assertGreater( data["question"]["category"] , 0)
     
+    def test_quiz_full_game(self):
+        """
+        playing a category to the end returns every question exactly once then None
+        """
+        previous_questions = []
+        while True:
+            res=self.client().post("/quizzes",json={"previous_questions":previous_questions,"quiz_category":{"type":"Entertainment","id":"5"}})
+            data=json.loads(res.data)
+            self.assertEqual(res.status_code , 200)
+            if data["question"] is None:
+                break
+            self.assertNotIn(data["question"]["id"] , previous_questions)
+            previous_questions.append(data["question"]["id"])
+        self.assertEqual(len(previous_questions) , 3)
+
+    def test_quiz_foreign_previous_questions(self):
+        """
+        previous question ids from another category must not end the quiz early or hang it
+        """
+        other_ids = [question.id for question in Question.query.filter(Question.category != 5).limit(3).all()]
+        res=self.client().post("/quizzes",json={"previous_questions":other_ids,"quiz_category":{"type":"Entertainment","id":"5"}})
+        data=json.loads(res.data)
+        self.assertEqual(res.status_code , 200)
+        self.assertIsNotNone(data["question"])
+        self.assertEqual(data["question"]["category"] , 5)
+
+    def test_quiz_index(self):
+        """
+        the quiz index follows the inserts and deletes , the quiz draws the only question left
+        """
+        asked = list(question_index.ids[5])
+        test_q = Question(question="index?" , answer="test" , category=5 , difficulty=1)
+        test_q.insert()
+        self.assertIn(test_q.id , question_index.ids[5])
+        self.assertIn(test_q.id , question_index.ids[0])
+        res=self.client().post("/quizzes",json={"previous_questions":asked,"quiz_category":{"type":"Entertainment","id":"5"}})
+        data=json.loads(res.data)
+        self.assertEqual(data["question"]["id"] , test_q.id)
+        test_q.delete()
+        self.assertNotIn(test_q.id , question_index.ids[0])
+        res=self.client().post("/quizzes",json={"previous_questions":asked,"quiz_category":{"type":"Entertainment","id":"5"}})
+        self.assertIsNone(json.loads(res.data)["question"])
+
+    def test_quiz_index_refresh(self):
+        """
+        questions written around the listeners (by another worker) are found by the next check or dropped when drawn
+        """
+        test_q = Question(question="other worker?" , answer="test" , category=5 , difficulty=1)
+        db.session.add(test_q)
+        db.session.commit()
+        self.assertNotIn(test_q.id , question_index.ids[5])
+        asked = list(question_index.ids[5])
+        question_index.next_check = 0
+        res=self.client().post("/quizzes",json={"previous_questions":asked,"quiz_category":{"type":"Entertainment","id":"5"}})
+        self.assertEqual(json.loads(res.data)["question"]["id"] , test_q.id)
+        db.session.delete(test_q)
+        db.session.commit()
+        res=self.client().post("/quizzes",json={"previous_questions":asked,"quiz_category":{"type":"Entertainment","id":"5"}})
+        self.assertIsNone(json.loads(res.data)["question"])
+        self.assertNotIn(test_q.id , question_index.ids[0])
+
+    def test_quiz_session(self):
+        """
+        a server side session asks every question of the category once , the turns only send the token
+        """
+        res=self.client().post("/quizzes",json={"previous_questions":[],"quiz_category":{"type":"Entertainment","id":"5"},"session":True})
+        data=json.loads(res.data)
+        self.assertEqual(res.status_code , 200)
+        token = data["session"]
+        asked = [data["question"]["id"]]
+        while True:
+            res=self.client().post("/quizzes",json={"session":token})
+            data=json.loads(res.data)
+            self.assertEqual(res.status_code , 200)
+            if data["question"] is None:
+                break
+            self.assertEqual(data["question"]["category"] , 5)
+            asked.append(data["question"]["id"])
+        self.assertEqual(sorted(asked) , sorted(question_index.ids[5]))
+
+    def test_quiz_session_refresh(self):
+        """
+        a new session also sees the questions inserted by another worker
+        """
+        test_q = Question(question="other worker?" , answer="test" , category=5 , difficulty=1)
+        db.session.add(test_q)
+        db.session.commit()
+        asked = list(question_index.ids[5])
+        question_index.next_check = 0
+        res=self.client().post("/quizzes",json={"previous_questions":asked,"quiz_category":{"type":"Entertainment","id":"5"},"session":True})
+        self.assertEqual(json.loads(res.data)["question"]["id"] , test_q.id)
+        test_q.delete()
+
+    def test_quiz_session_error(self):
+        """
+        an unknown or finished session returns 404
+        """
+        res=self.client().post("/quizzes",json={"session":"not-a-session"})
+        self.assertEqual(res.status_code , 404)
+
     def test_quiz_error(self):
         """
         test that we get error 422 if a question is requested with a non existent category.
@@ -4,8 +4,10 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, setup_db, Drink, db
+from .database.menu_cache import menu_cache
+from .database.pool import pool_status
+from .auth.auth import AuthError, requires_auth, verified_tokens
 
 app = Flask(__name__)
 setup_db(app)
@@ -18,6 +20,26 @@ CORS(app)
 '''
 db_drop_and_create_all()
 
+
+def menu_response(form):
+    '''
+    the drinks menu in the given representation ('short' or 'long'),
+    served from menu_cache and answered with 304 when the client already
+    has the current version (If-None-Match)
+    '''
+    def build():
+        # from the primary: a lagging replica would cache the menu from
+        # before the write that invalidated it until the next write
+        db.use_primary()
+        drinks = [getattr(drink, form)() for drink in Drink.query.all()]
+        return json.dumps({'success': True, 'drinks': drinks}).encode('utf-8')
+
+    body, etag = menu_cache.get(form, build)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
 # ROUTES
 '''
 @TODO_DONE implement endpoint
@@ -32,11 +54,7 @@ db_drop_and_create_all()
 
 @app.route('/drinks', methods=['GET'])
 def list_drinks():
-    drinks = Drink.query.all()
-    return jsonify({
-        'success': True,
-        'drinks': [drink.short() for drink in drinks]
-    })
+    return menu_response('short')
 
 
 '''
@@ -53,11 +71,7 @@ def list_drinks():
 @app.route('/drinks-detail', methods=['GET'])
 @requires_auth(permission="get:drinks-detail")
 def list_drinks_details():
-    drinks = Drink.query.all()
-    return jsonify({
-        'success': True,
-        'drinks': [drink.long() for drink in drinks]
-    })
+    return menu_response('long')
 
 
 '''
@@ -155,6 +169,25 @@ def delete_drink(drink_id):
         'delete': drink_id})
 
 
+'''
+GET /debug/pool
+    the state of the connection pool of this worker (checked out and idle
+    connections, overflow, checkout wait times), for monitoring.
+GET /debug/tokens
+    the verified token cache of this worker (size, hits, misses, evictions
+    and expirations).
+    only served when POOL_ENDPOINT=1, keep it off on public deployments
+'''
+if os.environ.get('POOL_ENDPOINT') == '1':
+    @app.route('/debug/pool', methods=['GET'])
+    def get_pool():
+        return jsonify(pool_status(db.engine))
+
+    @app.route('/debug/tokens', methods=['GET'])
+    def get_verified_tokens():
+        return jsonify(verified_tokens.stats())
+
+
 # Error Handling
 @app.errorhandler(422)
 def unprocessable(error):
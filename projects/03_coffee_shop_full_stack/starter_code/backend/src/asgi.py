@@ -0,0 +1,216 @@
+import os
+import json
+import sqlite3
+import contextlib
+
+from databases import Database
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from .database.models import Drink, database_path
+from .database.menu_cache import menu_cache
+from .auth.auth import AuthError, requires_auth_async
+
+'''
+ASGI entry point
+    the routes of src/api.py with async handlers, an async database driver
+    (databases, on aiosqlite or asyncpg) and jwks fetches that do not block
+    the event loop, so one worker process can hold many concurrent
+    connections. it is optional: install requirements-asgi.txt and run
+
+        uvicorn src.asgi:app --workers 2
+
+    from the backend directory. the tables are created by the flask app
+    (src/api.py), this app only reads and writes them. the drinks menu is
+    served from the same menu_cache, set MENU_CACHE_VERSION_FILE when the
+    flask and the ASGI workers run side by side.
+'''
+
+drinks = Drink.__table__
+
+
+def database_options(url):
+    '''
+    asyncpg pool bounds from the same DB_POOL_SIZE / DB_MAX_OVERFLOW
+    environment variables as the flask app (see database/pool.py)
+    '''
+    if not url.startswith('postgres'):
+        return {}
+    size = int(os.environ.get('DB_POOL_SIZE', 5))
+    return {
+        'min_size': size,
+        'max_size': size + int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    }
+
+
+database = Database(database_path, **database_options(database_path))
+
+# the unique title violation of each driver
+INTEGRITY_ERRORS = (sqlite3.IntegrityError,)
+try:
+    import asyncpg
+    INTEGRITY_ERRORS += (asyncpg.IntegrityConstraintViolationError,)
+except ImportError:
+    pass
+
+
+def drink_from_row(row):
+    return Drink(id=row['id'], title=row['title'], recipe=row['recipe'])
+
+
+async def fetch_drink(drink_id):
+    row = await database.fetch_one(
+        drinks.select().where(drinks.c.id == drink_id))
+    return None if row is None else drink_from_row(row)
+
+
+async def menu_response(request, form):
+    '''
+    the drinks menu in the given representation, from menu_cache like the
+    flask app, answered with 304 when the client has the current version
+    '''
+    version, cached = menu_cache.lookup(form)
+    if cached is None:
+        rows = await database.fetch_all(drinks.select())
+        drinks_menu = [getattr(drink_from_row(row), form)() for row in rows]
+        body = json.dumps({'success': True, 'drinks': drinks_menu})
+        cached = menu_cache.store(form, version, body.encode('utf-8'))
+    body, etag = cached
+    etag = '"{}"'.format(etag)
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type='application/json',
+                    headers={'ETag': etag})
+
+
+async def drink_request(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400)
+
+
+# ROUTES
+
+async def list_drinks(request):
+    return await menu_response(request, 'short')
+
+
+@requires_auth_async(permission='get:drinks-detail')
+async def list_drinks_details(request):
+    return await menu_response(request, 'long')
+
+
+@requires_auth_async(permission='post:drinks')
+async def create_drink(request):
+    body = await drink_request(request)
+    try:
+        values = {'title': body['title'],
+                  'recipe': json.dumps(body['recipe'])}
+    except (KeyError, TypeError):
+        raise HTTPException(400)
+    query = drinks.insert().values(**values)
+    if database.url.dialect.startswith('postgres'):
+        # asyncpg only returns the new id through RETURNING
+        query = query.returning(drinks.c.id)
+    try:
+        drink_id = await database.execute(query)
+    except INTEGRITY_ERRORS:
+        return JSONResponse({
+            'success': False,
+            'message': "This drink name already exists",
+            'error': 422
+        }, status_code=422)
+    menu_cache.invalidate()
+    drink = Drink(id=drink_id, **values)
+    return JSONResponse({'success': True, 'drinks': [drink.long()]})
+
+
+@requires_auth_async(permission='patch:drinks')
+async def update_drink(request):
+    drink_id = request.path_params['drink_id']
+    body = await drink_request(request)
+    values = {}
+    if 'title' in body:
+        values['title'] = body['title']
+    if 'recipe' in body:
+        values['recipe'] = json.dumps(body['recipe'])
+    # written first and read back: a read then write transaction can not
+    # upgrade its lock on sqlite while other writers wait.
+    if values:
+        await database.execute(
+            drinks.update().where(drinks.c.id == drink_id).values(**values))
+    drink = await fetch_drink(drink_id)
+    if drink is None:
+        raise HTTPException(404)
+    if values:
+        menu_cache.invalidate()
+    return JSONResponse({'success': True, 'drinks': [drink.long()]})
+
+
+@requires_auth_async(permission='delete:drinks')
+async def delete_drink(request):
+    drink_id = request.path_params['drink_id']
+    if await fetch_drink(drink_id) is None:
+        raise HTTPException(404)
+    await database.execute(drinks.delete().where(drinks.c.id == drink_id))
+    menu_cache.invalidate()
+    return JSONResponse({'success': True, 'delete': drink_id})
+
+
+# Error Handling
+
+ERROR_MESSAGES = {
+    400: 'malformed request',
+    404: 'resource not found',
+    405: 'method not allowed',
+    422: 'unprocessable'
+}
+
+
+async def http_error(request, exc):
+    return JSONResponse({
+        'success': False,
+        'error': exc.status_code,
+        'message': ERROR_MESSAGES.get(exc.status_code, exc.detail)
+    }, status_code=exc.status_code)
+
+
+async def auth_error(request, exc):
+    return JSONResponse({
+        'success': False,
+        'error': exc.status_code,
+        'message': exc.error['description']
+    }, status_code=exc.status_code)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await database.connect()
+    try:
+        yield
+    finally:
+        await database.disconnect()
+
+
+app = Starlette(
+    routes=[
+        Route('/drinks', list_drinks, methods=['GET']),
+        Route('/drinks-detail', list_drinks_details, methods=['GET']),
+        Route('/drinks', create_drink, methods=['POST']),
+        Route('/drinks/{drink_id:int}', update_drink, methods=['PATCH']),
+        Route('/drinks/{drink_id:int}', delete_drink, methods=['DELETE']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'],
+                   allow_methods=['*'], allow_headers=['*'])
+    ],
+    exception_handlers={
+        HTTPException: http_error,
+        AuthError: auth_error
+    },
+    lifespan=lifespan)
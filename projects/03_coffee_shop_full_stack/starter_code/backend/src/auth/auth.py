@@ -1,14 +1,43 @@
-import json
+import os
+import asyncio
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSCache, UrlJWKSSource, FileJWKSSource
+from .token_cache import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'v0nfsnd.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee'
 
+'''
+signing keys cache
+    the Auth0 keys are fetched once and kept by kid instead of fetching
+    /.well-known/jwks.json on every request, a background thread refreshes
+    them every JWKS_REFRESH_INTERVAL seconds.
+    set JWKS_FILE to serve the keys from a local jwks.json (e.g. in tests)
+'''
+if os.environ.get('JWKS_FILE'):
+    jwks_source = FileJWKSSource(os.environ['JWKS_FILE'])
+else:
+    jwks_source = UrlJWKSSource(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+jwks_cache = JWKSCache(
+    jwks_source,
+    ttl=int(os.environ.get('JWKS_TTL', 24 * 3600)),
+    refresh_interval=int(os.environ.get('JWKS_REFRESH_INTERVAL', 3600)))
+
+'''
+verified tokens cache
+    payloads of tokens that already passed verification, kept until the
+    token expires so repeated requests skip the RSA check.
+    TOKEN_CACHE_SIZE bounds the number of tokens kept (0 disables it)
+'''
+verified_tokens = VerifiedTokenCache(
+    max_size=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
 '''
 AuthError Exception
 A standardized way to communicate auth failure modes
@@ -34,7 +63,10 @@ class AuthError(Exception):
 
 
 def get_token_auth_header():
-    auth_headers = request.headers.get('Authorization', None)
+    return parse_auth_header(request.headers.get('Authorization', None))
+
+
+def parse_auth_header(auth_headers):
     if auth_headers is None:
         raise AuthError({
             'code': 'invalid_header',
@@ -43,8 +75,8 @@ def get_token_auth_header():
 
     auth_headrs_parts = auth_headers.split(' ')
 
-    if (len(auth_headrs_parts) < 2) or
-    (auth_headrs_parts[0].lower() != 'bearer'):
+    if (len(auth_headrs_parts) < 2) or \
+       (auth_headrs_parts[0].lower() != 'bearer'):
         raise AuthError({
             'code': 'invalid_token_format',
             'description': 'malformed token.'
@@ -89,9 +121,11 @@ def check_permissions(permission, payload):
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        (served from jwks_cache, see above)
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
+        (tokens verified before are served from verified_tokens)
 
     !!NOTE urlopen has a common certificate error described here:
     https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
@@ -99,9 +133,34 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+    return decode_jwt(token, jwks_cache.get_key(unverified_kid(token)))
+
+
+'''
+verify_decode_jwt_async(token)
+    same as verify_decode_jwt for the ASGI app (see src/asgi.py), a key
+    that is not cached yet is fetched in a worker thread so the jwks
+    request does not block the event loop
+'''
+
+
+async def verify_decode_jwt_async(token):
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+    kid = unverified_kid(token)
+    rsa_key = jwks_cache.cached_key(kid)
+    if rsa_key is None:
+        loop = asyncio.get_running_loop()
+        rsa_key = await loop.run_in_executor(None, jwks_cache.get_key, kid)
+    return decode_jwt(token, rsa_key)
+
+
+def unverified_kid(token):
     # Code provided by Auth0 docs
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     try:
         unverified_header = jwt.get_unverified_header(token)
     except jwt.JWTError:
@@ -110,22 +169,15 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
+    return unverified_header['kid']
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+
+def decode_jwt(token, rsa_key):
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -135,7 +187,7 @@ def verify_decode_jwt(token):
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
-
+            verified_tokens.put(token, payload)
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -183,3 +235,23 @@ def requires_auth(permission=''):
             return f(*args, **kwargs)
         return wrapper
     return requires_auth_decorator
+
+
+'''
+requires_auth_async(permission)
+    @requires_auth for the async handlers of the ASGI app, the handler is
+    called with the request and must be a coroutine function
+'''
+
+
+def requires_auth_async(permission=''):
+    def requires_auth_decorator(f):
+        @wraps(f)
+        async def wrapper(request):
+            token = parse_auth_header(
+                request.headers.get('Authorization', None))
+            payload = await verify_decode_jwt_async(token)
+            check_permissions(permission, payload)
+            return await f(request)
+        return wrapper
+    return requires_auth_decorator
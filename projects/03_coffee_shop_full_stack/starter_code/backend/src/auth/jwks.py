@@ -0,0 +1,138 @@
+import json
+import time
+import threading
+from urllib.request import urlopen
+
+'''
+JWKS sources
+    where the signing keys come from, anything with a fetch() method
+    returning the parsed jwks document ({"keys": [...]}) can be used
+'''
+
+
+class UrlJWKSSource:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+class FileJWKSSource:
+    '''
+    serves the keys from a local jwks.json, e.g. for tests
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path) as jwks_file:
+            return json.load(jwks_file)
+
+
+'''
+JWKSCache
+    keeps the signing keys indexed by kid so verifying a token does not
+    fetch the jwks document on every request.
+    the keys are refetched when
+        they are older than ttl seconds
+        a token names a kid we do not know (key rotation), at most once
+        every min_refresh_interval seconds so unknown kids can not be
+        used to hammer the jwks endpoint
+        refresh_interval is set: a background thread then refetches them
+        before they expire, keeping the fetch off the request path
+    if a refetch fails the previous keys keep being served.
+'''
+
+
+class JWKSCache:
+    def __init__(self, source, ttl=3600, refresh_interval=None,
+                 min_refresh_interval=30):
+        self.source = source
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.keys = {}
+        self.fetched_at = None
+        self.attempted_at = None
+        self.lock = threading.Lock()
+        self.refresher = None
+
+    def refresh(self):
+        '''
+        refetches the keys, returns the kid indexed keys
+        '''
+        with self.lock:
+            self.attempted_at = time.monotonic()
+            jwks = self.source.fetch()
+            keys = {}
+            for key in jwks['keys']:
+                keys[key['kid']] = {
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key['use'],
+                    'n': key['n'],
+                    'e': key['e']
+                }
+            self.keys = keys
+            self.fetched_at = time.monotonic()
+            return keys
+
+    def is_fresh(self):
+        return self.fetched_at is not None and \
+            time.monotonic() - self.fetched_at < self.ttl
+
+    def can_force_refresh(self):
+        return self.attempted_at is None or \
+            time.monotonic() - self.attempted_at >= self.min_refresh_interval
+
+    def try_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # without any key there is nothing to fall back to.
+            if not self.keys:
+                raise
+            print('jwks refresh failed, serving cached keys: ' + str(e))
+
+    def get_key(self, kid):
+        '''
+        returns the key with the given kid or None if the issuer has no such key
+        '''
+        if not self.is_fresh() and self.can_force_refresh():
+            self.try_refresh()
+        self.start_background_refresh()
+        key = self.keys.get(kid)
+        if key is None and self.can_force_refresh():
+            self.try_refresh()
+            key = self.keys.get(kid)
+        return key
+
+    def cached_key(self, kid):
+        '''
+        returns the key with the given kid when it can be served without
+        fetching the keys, None otherwise (then use get_key)
+        '''
+        if not self.is_fresh():
+            return None
+        self.start_background_refresh()
+        return self.keys.get(kid)
+
+    def start_background_refresh(self):
+        if self.refresh_interval is None:
+            return
+        if self.refresher is not None and self.refresher.is_alive():
+            return
+        self.refresher = threading.Thread(target=self.refresh_forever,
+                                          name='jwks-refresh', daemon=True)
+        self.refresher.start()
+
+    def refresh_forever(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print('background jwks refresh failed: ' + str(e))
@@ -0,0 +1,77 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+'''
+VerifiedTokenCache
+    bounded LRU of tokens that already passed signature and claims checks,
+    clients send the same access token until it expires so the RS256
+    verification only has to run once per token instead of once per request.
+    entries are keyed by the sha256 of the token (the raw tokens are never
+    kept) and dropped once the token's exp has passed.
+'''
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        '''
+        returns the decoded payload of a verified, unexpired token or None
+        '''
+        key = self.key(token)
+        with self.lock:
+            entry = self.tokens.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self.tokens[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.tokens.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        '''
+        remembers a verified token until its exp claim,
+        tokens without exp are not cached
+        '''
+        if self.max_size <= 0 or 'exp' not in payload:
+            return
+        key = self.key(token)
+        with self.lock:
+            self.tokens[key] = (payload, payload['exp'])
+            self.tokens.move_to_end(key)
+            while len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.tokens),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
@@ -0,0 +1,95 @@
+import os
+import time
+import hashlib
+import threading
+
+'''
+MenuCache
+    the drinks menu serialized once and kept as ready to send bytes together
+    with its ETag, so listing the menu does not parse every recipe and
+    re-serialize every drink on each request.
+    one entry is kept per representation ('short' and 'long'), all of them
+    are dropped by invalidate() which the Drink model calls after every
+    insert, update and delete.
+
+    by default invalidations are only seen by the current process, set
+    version_file (MENU_CACHE_VERSION_FILE) to a path shared by all the
+    workers of a host: invalidate() then touches it and every worker
+    rebuilds its menu on the next request.
+'''
+
+
+class MenuCache:
+    def __init__(self, version_file=None):
+        self.version_file = version_file
+        self.local_version = 0
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        if self.version_file is None:
+            return self.local_version
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get(self, form, build):
+        '''
+        returns (body, etag) of the given representation,
+        build() is called to produce the body bytes when it is not cached
+        '''
+        version, cached = self.lookup(form)
+        if cached is not None:
+            return cached
+        return self.store(form, version, build())
+
+    def lookup(self, form):
+        '''
+        returns (version, (body, etag)) when the representation is cached,
+        (version, None) otherwise: build the body and pass it to store()
+        with that version. get() does both, the async handlers of
+        src/asgi.py build the body themselves.
+        '''
+        version = self.version()
+        entry = self.entries.get(form)
+        if entry is not None and entry[2] == version:
+            self.hits += 1
+            return version, (entry[0], entry[1])
+        self.misses += 1
+        return version, None
+
+    def store(self, form, version, body):
+        '''
+        keeps a body built from the menu at version, returns (body, etag)
+        '''
+        etag = hashlib.sha1(body).hexdigest()
+        with self.lock:
+            # a write that happened while building must not be hidden
+            # behind the menu we built before it.
+            if self.version() == version:
+                self.entries[form] = (body, etag, version)
+        return body, etag
+
+    def invalidate(self):
+        with self.lock:
+            self.local_version += 1
+            self.entries = {}
+        if self.version_file is not None:
+            with open(self.version_file, 'a'):
+                pass
+            previous = self.version()
+            now = max(time.time_ns(), previous + 1)
+            os.utime(self.version_file, ns=(now, now))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries)
+        }
+
+
+menu_cache = MenuCache(os.environ.get('MENU_CACHE_VERSION_FILE'))
@@ -1,13 +1,19 @@
 import os
 from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .menu_cache import menu_cache
+from .pool import engine_options
+from .routing import RoutingSQLAlchemy, replica_binds
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.environ.get(
+    'DATABASE_URL',
+    "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 
-db = SQLAlchemy()
+# GET requests read from the DATABASE_REPLICA_URLS replicas, see routing.py
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
@@ -16,6 +22,9 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # pool size, overflow, timeouts... from the DB_* environment variables
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
+    app.config["SQLALCHEMY_BINDS"] = replica_binds()
     db.app = app
     db.init_app(app)
 
@@ -28,6 +37,7 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    menu_cache.invalidate()
 
 '''
 Drink
@@ -77,6 +87,7 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        menu_cache.invalidate()
 
     '''
     delete()
@@ -89,6 +100,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        menu_cache.invalidate()
 
     '''
     update()
@@ -101,6 +113,7 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        menu_cache.invalidate()
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
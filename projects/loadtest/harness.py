@@ -0,0 +1,286 @@
+'''
+load test harness shared by the backend targets (see targets.py)
+
+drives the endpoints of a flask app either through its test client or through a
+local threaded WSGI server (an ASGI app through a local uvicorn server), and measures for every endpoint the latency
+percentiles, the throughput and the number of SQL statements per request.
+'''
+import json
+import time
+import threading
+import urllib.parse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+
+class Endpoint:
+    '''
+    one route to drive
+    @param name : the key of the endpoint in the report , e.g. "GET /venues"
+    @param path , json , data , headers : the request , each can be a callable taking the
+           request number so every request can target a different row
+    @param expect : the accepted status codes
+    @param write : writes are not warmed up and run after every read of the target
+    @param max_requests : caps the requests of an endpoint that runs out of rows , e.g. a delete
+    @param verify : called with the number of requests once they are done , returns how many of them
+           did not write (an app may answer 200 after rolling back) , they are counted as errors
+    '''
+    def __init__(self, method, path, name=None, json=None, data=None, headers=None,
+                 expect=(200,), write=False, max_requests=None, verify=None):
+        self.method = method
+        self.path = path
+        self.name = name or '{} {}'.format(method, path)
+        self.json = json
+        self.data = data
+        self.headers = headers
+        self.expect = expect
+        self.write = write
+        self.max_requests = max_requests
+        self.verify = verify
+
+    def request(self, i):
+        def resolve(value):
+            return value(i) if callable(value) else value
+        return {
+            'method': self.method,
+            'path': resolve(self.path),
+            'json': resolve(self.json),
+            'data': resolve(self.data),
+            'headers': resolve(self.headers) or {}
+        }
+
+
+class QueryCounter:
+    '''
+    counts the statements sent through an engine , from any thread.
+    targets whose app does not use a SQLAlchemy engine pass None , they report no query count.
+    '''
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+
+    def __enter__(self):
+        if self.engine is not None:
+            event.listen(self.engine, 'before_cursor_execute', self.on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.engine is not None:
+            event.remove(self.engine, 'before_cursor_execute', self.on_execute)
+
+
+class TestClientDriver:
+    '''
+    sends the requests in process and in sequence through app.test_client()
+    '''
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, request):
+        response = self.client.open(request['path'], method=request['method'], json=request['json'],
+                                    data=request['data'], headers=request['headers'])
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    '''
+    sends real HTTP requests to a server listening on base_url
+    '''
+    base_url = None
+
+    def send(self, request):
+        headers = dict(request['headers'])
+        body = None
+        if request['json'] is not None:
+            body = json.dumps(request['json']).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif request['data'] is not None:
+            body = urllib.parse.urlencode(request['data']).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        http_request = urllib.request.Request(self.base_url + request['path'], data=body,
+                                              headers=headers, method=request['method'])
+        try:
+            with urllib.request.urlopen(http_request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+
+class WSGIServerDriver(HTTPDriver):
+    '''
+    serves the app from a local threaded WSGI server and sends real HTTP requests to it
+    '''
+    def __init__(self, app):
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietRequestHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class ASGIServerDriver(HTTPDriver):
+    '''
+    serves an ASGI app from a local single process uvicorn server (one event loop)
+    and sends real HTTP requests to it , the same way WSGIServerDriver does
+    '''
+    def __init__(self, app):
+        import socket
+        import uvicorn
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.base_url = 'http://127.0.0.1:{}'.format(self.socket.getsockname()[1])
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level='warning', access_log=False,
+                                                    lifespan='on'))
+        self.thread = threading.Thread(target=self.server.run, kwargs={'sockets': [self.socket]},
+                                       daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError('the ASGI server did not start')
+            time.sleep(0.01)
+
+    def close(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+DRIVERS = {
+    'client': TestClientDriver,
+    'wsgi': WSGIServerDriver,
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_endpoint(driver, endpoint, engine, n_requests, concurrency=1, warmup=3):
+    '''
+    sends n_requests requests (numbered 0 to n_requests - 1) to one endpoint and summarizes them
+    @return the endpoint report (a json serializable dict)
+    '''
+    if endpoint.max_requests is not None:
+        n_requests = min(n_requests, endpoint.max_requests)
+    if not endpoint.write:
+        for i in range(warmup):
+            driver.send(endpoint.request(i))
+
+    latencies = []
+    errors = []
+
+    def timed(i):
+        start = time.perf_counter()
+        status = driver.send(endpoint.request(i))
+        latencies.append(time.perf_counter() - start)
+        if status not in endpoint.expect:
+            errors.append(status)
+
+    with QueryCounter(engine) as queries:
+        start = time.perf_counter()
+        if concurrency <= 1:
+            for i in range(n_requests):
+                timed(i)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(timed, range(n_requests)))
+        elapsed = time.perf_counter() - start
+    not_written = endpoint.verify(n_requests) if endpoint.verify else 0
+
+    return {
+        'requests': n_requests,
+        'errors': len(errors) + not_written,
+        'not_written': not_written,
+        'error_statuses': sorted(set(errors)),
+        'mean_ms': round(1000 * sum(latencies) / len(latencies), 3),
+        'p50_ms': round(1000 * percentile(latencies, 0.50), 3),
+        'p95_ms': round(1000 * percentile(latencies, 0.95), 3),
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 3),
+        'throughput_rps': round(n_requests / elapsed, 1),
+        'queries_per_request': round(queries.count / n_requests, 2) if engine is not None else None
+    }
+
+
+def run_target(app, engine, endpoints, n_requests, mode='client', concurrency=1, warmup=3, log=None):
+    '''
+    drives every endpoint of a target , reads first then writes
+    @return {endpoint name: endpoint report}
+    '''
+    if hasattr(app, 'wsgi_app'):
+        driver = DRIVERS[mode](app)
+    else:
+        # an ASGI app can only be served over HTTP , whatever the mode.
+        driver = ASGIServerDriver(app)
+    results = {}
+    try:
+        ordered = [e for e in endpoints if not e.write] + [e for e in endpoints if e.write]
+        for endpoint in ordered:
+            results[endpoint.name] = run_endpoint(driver, endpoint, engine, n_requests,
+                                                  concurrency=concurrency, warmup=warmup)
+            if log:
+                log(endpoint.name, results[endpoint.name])
+    finally:
+        driver.close()
+    return results
+
+
+def format_queries(queries_per_request):
+    return '-' if queries_per_request is None else '{:.2f}'.format(queries_per_request)
+
+
+def compare(base, new, threshold=0.2):
+    '''
+    diffs two reports written by run.py
+    an endpoint regresses when its p95 grew by more than threshold (a fraction) ,
+    when it runs more queries per request or when it started failing.
+    @return (lines to print , whether any endpoint regressed)
+    '''
+    lines = []
+    regressed = False
+    for setting in ('rows', 'requests', 'mode', 'concurrency', 'database'):
+        if base['meta'].get(setting) != new['meta'].get(setting):
+            lines.append('warning: the reports differ in {} ({} -> {})'.format(
+                setting, base['meta'].get(setting), new['meta'].get(setting)))
+    for backend in sorted(set(base['results']) | set(new['results'])):
+        base_endpoints = base['results'].get(backend, {})
+        new_endpoints = new['results'].get(backend, {})
+        for name in sorted(set(base_endpoints) | set(new_endpoints)):
+            old, cur = base_endpoints.get(name), new_endpoints.get(name)
+            if old is None or cur is None:
+                lines.append('{:<11} {:<36} {}'.format(backend, name, 'added' if old is None else 'removed'))
+                continue
+            problems = []
+            if cur['p95_ms'] > old['p95_ms'] * (1 + threshold):
+                problems.append('p95')
+            if None not in (old['queries_per_request'], cur['queries_per_request']) and \
+                    cur['queries_per_request'] > old['queries_per_request']:
+                problems.append('queries')
+            if cur['errors'] > old['errors']:
+                problems.append('errors')
+            regressed = regressed or bool(problems)
+            lines.append('{:<11} {:<36} p95 {:9.3f} -> {:9.3f} ms  queries {:>7} -> {:>7}  {}'.format(
+                backend, name, old['p95_ms'], cur['p95_ms'], format_queries(old['queries_per_request']),
+                format_queries(cur['queries_per_request']),
+                'REGRESSION ({})'.format(', '.join(problems)) if problems else 'ok'))
+    return lines, regressed
@@ -0,0 +1,162 @@
+'''
+load test and latency benchmark for the fyyur , trivia and coffee shop backends
+
+    python run.py run [--backends fyyur trivia coffee coffee-asgi] [--rows 1000] [--requests 200]
+                      [--mode client|wsgi] [--concurrency 1] [--database sqlite|URL]
+                      [--output report.json]
+    python run.py compare base.json new.json [--threshold 0.2]
+
+run seeds every backend with --rows synthetic rows and writes one json report ,
+compare diffs two reports and exits with 1 when an endpoint regressed.
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import warnings
+import platform
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from harness import run_target, compare, format_queries, DRIVERS  # noqa: E402
+from targets import TARGETS, DEFAULT_TARGETS  # noqa: E402
+
+
+def git_sha():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def worker(args):
+    '''
+    seeds and drives one backend , runs in its own process (see targets.py)
+    '''
+    setup = TARGETS[args.backend]
+    app, engine, endpoints = setup(args.database, args.rows, args.requests)
+    # fyyur uses the deprecated flask_wtf.Form on every request and flask_wtf
+    # asks for that warning to be printed every time , after it was imported.
+    warnings.simplefilter('ignore')
+
+    def log(name, result):
+        # the apps print to stdout , the progress goes to stderr.
+        sys.stderr.write('{:<11} {:<36} p50 {:9.3f} ms  p95 {:9.3f} ms  {:8.1f} req/s  {:>6} queries{}\n'.format(
+            args.backend, name, result['p50_ms'], result['p95_ms'], result['throughput_rps'],
+            format_queries(result['queries_per_request']), '  {} errors {}{}'.format(
+                result['errors'], result['error_statuses'],
+                ' , {} not written'.format(result['not_written']) if result['not_written'] else '')
+            if result['errors'] else ''))
+
+    results = run_target(app, engine, endpoints, args.requests, mode=args.mode,
+                         concurrency=args.concurrency, warmup=args.warmup, log=log)
+    with open(args.result, 'w') as result_file:
+        json.dump(results, result_file)
+
+
+def run(args):
+    report = {
+        'meta': {
+            'git_sha': git_sha(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'rows': args.rows,
+            'requests': args.requests,
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'database': 'sqlite' if args.database == 'sqlite' else args.database.split('://', 1)[0]
+        },
+        'results': {}
+    }
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    failed = False
+    try:
+        for backend in args.backends:
+            if args.database == 'sqlite':
+                database = 'sqlite:///' + os.path.join(workdir, backend + '.db')
+            else:
+                database = args.database.format(backend=backend)
+            result_path = os.path.join(workdir, backend + '.json')
+            command = [sys.executable, os.path.abspath(__file__), 'worker', backend,
+                       '--database', database, '--result', result_path,
+                       '--rows', str(args.rows), '--requests', str(args.requests),
+                       '--mode', args.mode, '--concurrency', str(args.concurrency),
+                       '--warmup', str(args.warmup)]
+            # the backends print while seeding , keep their stdout away from ours.
+            code = subprocess.call(command, cwd=workdir, stdout=subprocess.DEVNULL)
+            if code != 0 or not os.path.exists(result_path):
+                print('{} failed (exit code {})'.format(backend, code))
+                failed = True
+                continue
+            with open(result_path) as result_file:
+                report['results'][backend] = json.load(result_file)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    errors = sum(result['errors'] for endpoints in report['results'].values() for result in endpoints.values())
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        print('report written to ' + args.output)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    if errors:
+        print('{} requests returned an unexpected status'.format(errors))
+    return 1 if failed or errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='seed and drive the backends')
+    run_parser.add_argument('--backends', nargs='+', default=DEFAULT_TARGETS, choices=sorted(TARGETS))
+    run_parser.add_argument('--rows', type=int, default=1000)
+    run_parser.add_argument('--requests', type=int, default=200)
+    run_parser.add_argument('--mode', choices=sorted(DRIVERS), default='client')
+    run_parser.add_argument('--concurrency', type=int, default=1)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--database', default='sqlite',
+                            help='"sqlite" for a throwaway file per backend or a database url '
+                                 'where {backend} is replaced by the backend name')
+    run_parser.add_argument('--output', help='where to write the json report , stdout by default')
+
+    compare_parser = commands.add_parser('compare', help='diff two reports')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='accepted p95 growth as a fraction (0.2 = 20%%)')
+
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('backend', choices=sorted(TARGETS))
+    worker_parser.add_argument('--database', required=True)
+    worker_parser.add_argument('--result', required=True)
+    worker_parser.add_argument('--rows', type=int, required=True)
+    worker_parser.add_argument('--requests', type=int, required=True)
+    worker_parser.add_argument('--mode', choices=sorted(DRIVERS), required=True)
+    worker_parser.add_argument('--concurrency', type=int, required=True)
+    worker_parser.add_argument('--warmup', type=int, required=True)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        sys.exit(run(args))
+    elif args.command == 'compare':
+        with open(args.base) as base, open(args.new) as new:
+            lines, regressed = compare(json.load(base), json.load(new), args.threshold)
+        print('\n'.join(lines))
+        sys.exit(1 if regressed else 0)
+    elif args.command == 'worker':
+        worker(args)
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
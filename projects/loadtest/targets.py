@@ -0,0 +1,221 @@
+'''
+the backends the load test knows how to seed and drive
+
+each target imports its app from the project directory , seeds it with synthetic
+rows and returns (app , engine , endpoints). the apps keep module level state and
+some of their module names collide , so run.py sets up every target in its own process.
+'''
+import os
+import sys
+import json
+import time
+import base64
+import tempfile
+from datetime import datetime
+
+from harness import Endpoint
+
+PROJECTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FYYUR_DIR = os.path.join(PROJECTS_DIR, '01_fyyur', 'starter_code')
+TRIVIA_DIR = os.path.join(PROJECTS_DIR, '02_trivia_api', 'starter', 'backend')
+COFFEE_DIR = os.path.join(PROJECTS_DIR, '03_coffee_shop_full_stack', 'starter_code', 'backend')
+
+
+def fyyur(database_url, rows, n_requests):
+    '''
+    rows venues , half as many artists and three shows per venue
+    '''
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, FYYUR_DIR)
+    import bench
+    from app import app, db, Artist, Venue, Show, SHOWS_PER_PAGE
+
+    n_artists = max(1, rows // 2)
+    with app.app_context():
+        bench.seed(rows)
+        engine = db.engine
+        # (artist , venue) is the key of a show , every new show needs a pair the seed did not use
+        seeded = set(db.session.query(Show.artist_id, Show.venue_id))
+        free_pairs = [(artist_id, venue_id) for venue_id in range(1, rows + 1)
+                      for artist_id in range(1, n_artists + 1) if (artist_id, venue_id) not in seeded]
+        free_pairs = free_pairs[:n_requests] or [(1, 1)]
+    # the middle page of the 3 * rows seeded shows
+    shows_page = max(1, 3 * rows // SHOWS_PER_PAGE // 2)
+
+    def count_written(model, *condition):
+        # the requests of a write endpoint whose row is missing afterwards
+        def verify(n):
+            with app.app_context():
+                written = db.session.query(model).filter(*condition).count()
+                db.session.remove()
+            return max(0, n - written)
+        return verify
+
+    endpoints = [
+        Endpoint('GET', '/'),
+        Endpoint('GET', '/venues'),
+        Endpoint('POST', '/venues/search', data={'search_term': 'hall 1'}),
+        Endpoint('GET', lambda i: '/venues/{}'.format(1 + i % rows), name='GET /venues/<id>'),
+        Endpoint('GET', '/artists'),
+        Endpoint('POST', '/artists/search', data={'search_term': 'artist 1'}),
+        Endpoint('GET', lambda i: '/artists/{}'.format(1 + i % max(1, rows // 2)), name='GET /artists/<id>'),
+        Endpoint('GET', '/shows'),
+        Endpoint('GET', '/shows?page={}'.format(shows_page)),
+        Endpoint('GET', '/venues/create'),
+        Endpoint('GET', '/artists/create'),
+        Endpoint('GET', '/shows/create'),
+        Endpoint('POST', '/venues/create', write=True, data=lambda i: {
+            'name': 'Load Venue {}'.format(i), 'city': 'City 0', 'state': 'CA', 'address': 'street',
+            'phone': '1234567890', 'genres': 'Jazz', 'facebook_link': 'https://facebook.com/x'},
+            verify=count_written(Venue, Venue.name.like('Load Venue %'))),
+        Endpoint('POST', '/shows/create', write=True, max_requests=len(free_pairs), data=lambda i: {
+            'artist_id': free_pairs[i][0], 'venue_id': free_pairs[i][1],
+            'start_time': '2035-01-01 20:00:00'},
+            verify=count_written(Show, Show.start_time == datetime(2035, 1, 1, 20))),
+        # every venue is deleted once , the later ones first
+        Endpoint('DELETE', lambda i: '/venues/{}'.format(rows - i % rows), name='DELETE /venues/<id>',
+                 write=True, max_requests=rows),
+    ]
+    if not database_url.startswith('sqlite'):
+        # the create and edit forms of an artist assign the genres list as is to the genres column ,
+        # postgres casts it to text but sqlite can not bind it (the request answers 200 and rolls back).
+        endpoints += [
+            Endpoint('POST', '/artists/create', write=True, data=lambda i: {
+                'name': 'Load Artist {}'.format(i), 'city': 'City 0', 'state': 'CA',
+                'phone': '1234567890', 'genres': 'Jazz', 'facebook_link': 'https://facebook.com/x'},
+                verify=count_written(Artist, Artist.name.like('Load Artist %'))),
+            Endpoint('POST', lambda i: '/artists/{}/edit'.format(1 + i % max(1, rows // 2)),
+                     name='POST /artists/<id>/edit', write=True, expect=(302,), data=lambda i: {
+                'name': 'Edited Artist {}'.format(i), 'city': 'City 1', 'state': 'NY', 'genres': 'Jazz'}),
+            Endpoint('POST', lambda i: '/venues/{}/edit'.format(1 + i % rows),
+                     name='POST /venues/<id>/edit', write=True, expect=(302,), data=lambda i: {
+                'name': 'Edited Venue Hall {}'.format(i), 'city': 'City 1', 'state': 'NY', 'genres': 'Jazz'}),
+        ]
+    return app, engine, endpoints
+
+
+def trivia(database_url, rows, n_requests):
+    '''
+    rows questions spread over the six categories
+    '''
+    sys.path.insert(0, TRIVIA_DIR)
+    import bench
+    from flaskr import question_search, category_cache
+    from models import db, Question
+
+    app = bench.make_app(database_url)
+    with app.app_context():
+        bench.seed(max(1, rows // len(bench.CATEGORIES)))
+        # the seed bypasses the question listeners and the category cache.
+        question_search.configure(db.engine)
+        category_cache.load()
+        engine = db.engine
+        ids = [q_id for q_id, in db.session.query(Question.id).order_by(Question.id.desc()).limit(n_requests)]
+        middle_id = db.session.query(Question.id).order_by(Question.id).offset(rows // 2).limit(1).scalar() or 0
+
+    endpoints = [
+        Endpoint('GET', '/categories'),
+        Endpoint('GET', '/questions'),
+        Endpoint('GET', '/questions?page={}'.format(max(1, rows // 20))),
+        Endpoint('GET', '/questions?after_id={}'.format(middle_id)),
+        Endpoint('GET', '/categories/3/questions'),
+        Endpoint('POST', '/questions', name='POST /questions (search)', json={'searchTerm': 'question 111'}),
+        Endpoint('POST', '/quizzes', name='POST /quizzes (all)',
+                 json={'previous_questions': [], 'quiz_category': {'type': 'click', 'id': 0}}),
+        Endpoint('POST', '/quizzes', name='POST /quizzes (category)',
+                 json={'previous_questions': ids[:20], 'quiz_category': {'type': 'Science', 'id': 1}}),
+        Endpoint('POST', '/questions', name='POST /questions (create)', write=True, json=lambda i: {
+            'question': 'Load question {}?'.format(i), 'answer': 'yes', 'category': 1 + i % 6, 'difficulty': 1}),
+        Endpoint('DELETE', lambda i: '/questions/{}'.format(ids[i % len(ids)]),
+                 name='DELETE /questions/<id>', write=True, max_requests=len(ids)),
+    ]
+    return app, engine, endpoints
+
+
+def make_jwks():
+    '''
+    writes a jwks.json for a fresh RSA key and returns a token signed with it
+    granting every coffee shop permission
+    '''
+    from Crypto.PublicKey import RSA
+    from jose import jwt
+
+    def b64(number):
+        raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+    key = RSA.generate(2048)
+    jwks_path = os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'jwks.json')
+    with open(jwks_path, 'w') as jwks_file:
+        json.dump({'keys': [{'kty': 'RSA', 'kid': 'loadtest', 'use': 'sig', 'n': b64(key.n), 'e': b64(key.e)}]},
+                  jwks_file)
+    os.environ['JWKS_FILE'] = jwks_path
+    return jwt.encode({
+        'iss': 'https://v0nfsnd.us.auth0.com/',
+        'aud': 'coffee',
+        'sub': 'loadtest',
+        'exp': int(time.time()) + 24 * 3600,
+        'permissions': ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks']
+    }, key.export_key().decode('ascii'), algorithm='RS256', headers={'kid': 'loadtest'})
+
+
+def coffee(database_url, rows, n_requests):
+    '''
+    rows drinks with a three ingredient recipe
+    '''
+    os.environ['DATABASE_URL'] = database_url
+    token = make_jwks()
+    auth = {'Authorization': 'Bearer ' + token}
+    sys.path.insert(0, COFFEE_DIR)
+    # importing the api drops and recreates the tables.
+    from src.api import app
+    from src.database.models import db, Drink
+    from src.database.menu_cache import menu_cache
+
+    recipe = json.dumps([{'name': 'espresso', 'color': 'brown', 'parts': 1},
+                         {'name': 'milk', 'color': 'white', 'parts': 2},
+                         {'name': 'foam', 'color': 'beige', 'parts': 1}])
+    with app.app_context():
+        db.session.bulk_insert_mappings(Drink, [
+            {'id': i, 'title': 'Drink {}'.format(i), 'recipe': recipe} for i in range(1, rows + 1)])
+        db.session.commit()
+        menu_cache.invalidate()
+        engine = db.engine
+    etag = app.test_client().get('/drinks').headers.get('ETag')
+
+    endpoints = [
+        Endpoint('GET', '/drinks'),
+        Endpoint('GET', '/drinks', name='GET /drinks (If-None-Match)', headers={'If-None-Match': etag},
+                 expect=(304,)),
+        Endpoint('GET', '/drinks-detail', headers=auth),
+        Endpoint('GET', '/drinks-detail', name='GET /drinks-detail (no token)', expect=(401,)),
+        Endpoint('POST', '/drinks', headers=auth, write=True,
+                 json=lambda i: {'title': 'Load drink {}'.format(i), 'recipe': json.loads(recipe)}),
+        Endpoint('PATCH', lambda i: '/drinks/{}'.format(1 + i % rows), name='PATCH /drinks/<id>',
+                 headers=auth, write=True, json=lambda i: {'title': 'Patched drink {}'.format(i)}),
+        Endpoint('DELETE', lambda i: '/drinks/{}'.format(rows - i % rows), name='DELETE /drinks/<id>',
+                 headers=auth, write=True, max_requests=rows),
+    ]
+    return app, engine, endpoints
+
+
+def coffee_asgi(database_url, rows, n_requests):
+    '''
+    the coffee shop seeded like the coffee target , served by its optional ASGI app
+    (src/asgi.py , needs requirements-asgi.txt). its async driver does not go through
+    a SQLAlchemy engine so it reports no query count.
+    '''
+    _, _, endpoints = coffee(database_url, rows, n_requests)
+    from src.asgi import app
+    return app, None, endpoints
+
+
+TARGETS = {
+    'fyyur': fyyur,
+    'trivia': trivia,
+    'coffee': coffee,
+    'coffee-asgi': coffee_asgi,
+}
+
+# the targets run when --backends is not given , coffee-asgi needs extra packages
+DEFAULT_TARGETS = ['coffee', 'fyyur', 'trivia']